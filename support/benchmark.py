@@ -0,0 +1,265 @@
+"""
+Benchmark suite for the address book.
+
+Builds synthetic books (seeded, so every run gets the same data) and times
+add_contact, AddressBook.find, Record.find_phone / edit_phone, show_all and
+get_upcoming_birthdays. For every operation reports throughput, p50/p99 latency,
+and peak memory of building the book, then writes everything to a JSON file
+that can be compared with a previous run.
+
+With --shards N it also loads the same contacts into one AddressBook and into
+ShardedAddressBook with N worker processes, and times loading and a 365-day
+get_upcoming_birthdays scan on both. Speedup is one book time / sharded time,
+it can only go above 1 with at least N free CPU cores (cpu_count is in meta).
+
+Run from the repository root:
+    python support/benchmark.py --sizes 1000 10000 100000 --output results.json
+    python support/benchmark.py --sizes 1000 10000 --compare results.json
+    python support/benchmark.py --sizes 100000 --shards 4 --no-memory
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_integration import AddressBook, Record, ShardedAddressBook, add_contact, add_birthday, show_all
+
+FIRST_NAMES = [
+    "Olena", "Oleh", "Andrii", "Iryna", "Taras", "Natalia", "Dmytro", "Oksana", "Serhii", "Yulia",
+    "Mykola", "Kateryna", "Ivan", "Sofiia", "Petro", "Anna", "Bohdan", "Maria", "Yurii", "Halyna",
+    "John", "Jane", "Kevin", "Angela", "Oscar", "Pam", "Jim", "Dwight", "Michael", "Stanley",
+]
+LAST_NAMES = [
+    "Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Oliinyk", "Melnyk", "Lysenko",
+    "Boiko", "Savchenko", "Rudenko", "Moroz", "Marchenko", "Pavlenko", "Malone", "Martin", "Halpert",
+]
+# mobile operator codes, most contacts have numbers of the big ones
+OPERATOR_CODES = ["050", "066", "095", "099", "067", "068", "096", "097", "098", "063", "073", "093"]
+OPERATOR_WEIGHTS = [10, 8, 8, 6, 14, 8, 10, 12, 10, 6, 4, 4]
+
+
+def generate_contacts(count, seed=2024):
+    """
+    Yields (name, phones, birthday or None) for count distinct contacts.
+    Most contacts have one phone, some two or three; about 70% have a birthday,
+    years are spread around 1985 like in a working-age contact list (no Feb 29).
+    """
+    rnd = random.Random(seed)
+    for i in range(count):
+        name = f"{rnd.choice(FIRST_NAMES)}{rnd.choice(LAST_NAMES)}{i}"
+        phones_count = rnd.choices([1, 2, 3], weights=[75, 20, 5])[0]
+        phones = [
+            rnd.choices(OPERATOR_CODES, weights=OPERATOR_WEIGHTS)[0] + f"{rnd.randrange(10_000_000):07d}"
+            for _ in range(phones_count)
+        ]
+        birthday = None
+        if rnd.random() < 0.7:
+            year = min(2010, max(1935, int(rnd.gauss(1985, 14))))
+            born = date(year, 1, 1) + timedelta(days=rnd.randrange(365))
+            if (born.month, born.day) == (2, 29):
+                # get_upcoming_birthdays rejects the whole book with Feb 29 birthdays in common years
+                born += timedelta(days=1)
+            birthday = born.strftime("%d.%m.%Y")
+        yield name, phones, birthday
+
+
+def build_book(count, seed):
+    book = AddressBook()
+    for name, phones, birthday in generate_contacts(count, seed):
+        for phone in phones:
+            add_contact([name, phone], book)
+        if birthday is not None:
+            add_birthday([name, birthday], book)
+    return book
+
+
+def make_records(count, seed):
+    records = []
+    for name, phones, birthday in generate_contacts(count, seed):
+        record = Record(name)
+        for phone in phones:
+            record.add_phone(phone)
+        if birthday is not None:
+            record.add_birthday(birthday)
+        records.append(record)
+    return records
+
+
+def summarize(latencies_ns, total_seconds, operations):
+    latencies_ns.sort()
+    return {
+        "operations": operations,
+        "seconds": round(total_seconds, 6),
+        "ops_per_second": round(operations / total_seconds, 1) if total_seconds else None,
+        "p50_us": round(latencies_ns[len(latencies_ns) // 2] / 1000, 3) if latencies_ns else None,
+        "p99_us": round(latencies_ns[min(len(latencies_ns) - 1, len(latencies_ns) * 99 // 100)] / 1000, 3) if latencies_ns else None,
+    }
+
+
+def timed(calls):
+    """
+    Runs every zero-argument callable, returns summary of their latencies
+    """
+    latencies = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for call in calls:
+        before = clock()
+        call()
+        latencies.append(clock() - before)
+    return summarize(latencies, (clock() - started) / 1e9, len(latencies))
+
+
+def bench_size(count, seed, queries, memory=True):
+    results = {}
+    rnd = random.Random(seed + 1)
+    contacts = list(generate_contacts(count, seed))
+
+    book = AddressBook()
+    results["add_contact"] = timed(
+        (lambda name=name, phone=phone: add_contact([name, phone], book))
+        for name, phones, _ in contacts for phone in phones
+    )
+    for name, _, birthday in contacts:
+        if birthday is not None:
+            add_birthday([name, birthday], book)
+
+    sample = [rnd.choice(contacts) for _ in range(queries)]
+    results["find"] = timed((lambda name=name: book.find(name.title())) for name, _, _ in sample)
+    results["find_phone"] = timed(
+        (lambda record=book.find(name.title()), phone=phones[-1]: record.find_phone(phone)) for name, phones, _ in sample
+    )
+
+    def edit_back_and_forth(record, phone):
+        record.edit_phone(phone, "0000000000")
+        record.edit_phone("0000000000", phone)
+
+    results["edit_phone"] = timed(
+        (lambda record=book.find(name.title()), phone=phones[0]: edit_back_and_forth(record, phone)) for name, phones, _ in sample
+    )
+    results["edit_phone"]["operations"] *= 2
+
+    def render_all():
+        for _ in show_all(book):
+            pass
+
+    results["show_all"] = timed([render_all])
+    results["show_all"]["contacts_per_second"] = round(count / results["show_all"]["seconds"], 1)
+
+    def upcoming_uncached():
+        # results are cached until the book changes, a version bump stands for a change
+        book.version += 1
+        book.get_upcoming_birthdays()
+
+    upcoming_calls = max(1, queries // 100)
+    results["get_upcoming_birthdays"] = timed([upcoming_uncached] * upcoming_calls)
+    results["get_upcoming_birthdays_cached"] = timed([book.get_upcoming_birthdays] * upcoming_calls)
+
+    if memory:
+        del book
+        tracemalloc.start()
+        book = build_book(count, seed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["memory"] = {"peak_bytes": peak, "bytes_per_contact": round(peak / count, 1)}
+    return results
+
+
+def bench_shards(count, seed, shards, scans=5):
+    """
+    One AddressBook against ShardedAddressBook: bulk load and uncached 365-day birthday scan
+    """
+    results = {}
+    book = AddressBook()
+    records = make_records(count, seed)
+    results["one_book_load"] = timed([lambda: [book.add_record(record) for record in records]])
+
+    def scan_one_book():
+        book.version += 1 # a change would drop the cached result, the scan itself is timed
+        book.get_upcoming_birthdays(365)
+
+    results["one_book_upcoming_365"] = timed([scan_one_book] * scans)
+
+    sharded = ShardedAddressBook(shards)
+    try:
+        records = make_records(count, seed)
+        results["sharded_load"] = timed([lambda: sharded.add_records(records)])
+        results["sharded_upcoming_365"] = timed([lambda: sharded.get_upcoming_birthdays(365)] * scans)
+    finally:
+        sharded.close()
+    for operation in ("load", "upcoming_365"):
+        results[f"sharded_{operation}"]["speedup"] = round(
+            results[f"one_book_{operation}"]["seconds"] / results[f"sharded_{operation}"]["seconds"], 2
+        )
+    return results
+
+
+def compare(current, baseline):
+    print("\nchange against baseline (ops/s, >1 is faster):")
+    for size, operations in current["results"].items():
+        old_operations = baseline["results"].get(size)
+        if old_operations is None:
+            continue
+        for operation, numbers in operations.items():
+            old = old_operations.get(operation, {})
+            if numbers.get("ops_per_second") and old.get("ops_per_second"):
+                ratio = numbers["ops_per_second"] / old["ops_per_second"]
+                print(f"{size:>9} {operation:<30} x{ratio:.2f}")
+            elif "peak_bytes" in numbers and "peak_bytes" in old:
+                print(f"{size:>9} {operation:<30} peak {numbers['peak_bytes'] / old['peak_bytes']:.2f} of baseline")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--queries", type=int, default=10000, help="point lookups per size")
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory measurement (it builds every book twice)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file of previous run to compare with")
+    parser.add_argument("--shards", type=int, help="also compare one book with ShardedAddressBook of this many processes")
+    options = parser.parse_args()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "seed": options.seed,
+            "queries": options.queries,
+            "today": date.today().isoformat(), # birthday window depends on it
+            "cpu_count": os.cpu_count(), # sharded speedup is bounded by it
+        },
+        "results": {},
+    }
+    for size in options.sizes:
+        results = bench_size(size, options.seed, options.queries, memory=not options.no_memory)
+        if options.shards:
+            results.update(bench_shards(size, options.seed, options.shards))
+        report["results"][str(size)] = results
+        print(f"\n{size} contacts")
+        for operation, numbers in results.items():
+            if "peak_bytes" in numbers:
+                print(f"  {operation:<30} peak {numbers['peak_bytes'] / 2**20:.1f} MiB, {numbers['bytes_per_contact']} B/contact")
+            else:
+                speedup = f"  speedup x{numbers['speedup']}" if "speedup" in numbers else ""
+                print(f"  {operation:<30} {numbers['ops_per_second']:>12} ops/s  p50 {numbers['p50_us']} us  p99 {numbers['p99_us']} us{speedup}")
+
+    with open(options.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"\nresults written to {options.output}")
+
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as baseline:
+            compare(report, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures how many bytes one contact (Record + Name + 2 Phones + Birthday) costs.
+Compares current __slots__ classes from task_integration with the previous
+__dict__ based layout.
+
+Run from the repository root:
+    python support/bytes_per_contact.py [contacts_count]
+"""
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_integration import Record
+
+
+# Previous layout, every object keeps its own __dict__ ----------------------------------------------
+class DictField:
+    def __init__(self, value):
+        self._value = value
+
+
+class DictRecord:
+    def __init__(self, name):
+        self.name = DictField(name)
+        self.phones = []
+        self.birthday = None
+        self.book = None
+
+    def add_phone(self, phone_number):
+        self.phones.append(DictField(phone_number))
+
+    def add_birthday(self, birthday_string):
+        self.birthday = DictField(datetime.strptime(birthday_string, "%d.%m.%Y").date())
+
+
+def build(record_class, count):
+    records = []
+    for i in range(count):
+        record = record_class(f"Contact {i}")
+        record.add_phone(f"{i:010d}")
+        record.add_phone(f"{count + i:010d}")
+        record.add_birthday(f"{i % 28 + 1:02d}.{i % 12 + 1:02d}.{1950 + i % 60}")
+        records.append(record)
+    return records
+
+
+def bytes_per_contact(record_class, count):
+    tracemalloc.start()
+    records = build(record_class, count)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return used / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dict_bytes = bytes_per_contact(DictRecord, count)
+    slots_bytes = bytes_per_contact(Record, count)
+    print(f"contacts: {count}")
+    print(f"__dict__ layout: {dict_bytes:.0f} bytes per contact")
+    print(f"__slots__ layout: {slots_bytes:.0f} bytes per contact")
+    print(f"saved: {dict_bytes - slots_bytes:.0f} bytes per contact ({(1 - slots_bytes / dict_bytes) * 100:.0f}%)")
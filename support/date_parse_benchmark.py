@@ -0,0 +1,51 @@
+"""
+Compares Birthday date parsing: datetime.strptime against task_integration.parse_date
+without cache (every date is new) and with cache (dates repeat, like in bulk loads).
+
+Run from the repository root:
+    python support/date_parse_benchmark.py
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_integration import Birthday, parse_date
+
+rnd = random.Random(42)
+dates = [(date(1950, 1, 1) + timedelta(days=rnd.randint(0, 365 * 60))).strftime("%d.%m.%Y") for _ in range(20_000)]
+# bulk loads see the same birthdays many times
+repeated_dates = [dates[i % 1000] for i in range(len(dates))]
+
+
+def with_strptime():
+    for value in dates:
+        datetime.strptime(value, "%d.%m.%Y").date()
+
+
+def without_cache():
+    for value in dates:
+        parse_date.__wrapped__(value)
+
+
+def with_cache():
+    for value in repeated_dates:
+        parse_date(value)
+
+
+def birthdays():
+    for value in dates:
+        Birthday(value)
+
+
+if __name__ == "__main__":
+    # make sure the fast path gives the same answers before timing it
+    assert all(parse_date.__wrapped__(value) == datetime.strptime(value, "%d.%m.%Y").date() for value in dates)
+    with_cache()
+    for name, func in [("strptime", with_strptime), ("parse_date, no cache", without_cache),
+                       ("parse_date, cached", with_cache), ("Birthday()", birthdays)]:
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:>22}: {best / len(dates) * 1e6:.2f} us per date")
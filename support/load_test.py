@@ -0,0 +1,343 @@
+"""
+Load testing harness: replays recorded or synthetic command sessions against the bot
+and reports throughput, latency percentiles per command and error breakdown.
+
+Traces are JSON lines {"t": seconds from start, "session": number, "line": command line},
+the bot writes them with --record PATH, 'generate' makes synthetic ones.
+Lines marked "setup": true (contacts made by 'generate') are run first and not measured.
+
+Run from the repository root:
+    python task_integration.py --record trace.jsonl
+    python support/load_test.py generate --sessions 50 --commands 200 --write-ratio 0.2 --output trace.jsonl
+    python support/load_test.py replay trace.jsonl --concurrency 20 --speed 0
+    python support/load_test.py replay trace.jsonl --rate 500 --connect 127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_integration import AddressBook, BotSession, ErrorMessage, output_chunks, parse_input
+from benchmark import generate_contacts
+
+# first lines of answers that mean the command failed, used when replaying over socket
+ERROR_PREFIXES = (
+    "Wrong parameters are provided",
+    "Contact not found.",
+    "Enter user name.",
+    "Invalid command.",
+    "Transaction rolled back, command",
+    "Transaction is already open",
+    "There is no open transaction",
+    "Changes after",
+    "Server is busy",
+    "New number must has 10 digits",
+    "There is no such Contact",
+    "Can't read file",
+    "Can't write file",
+    "Unknown format",
+)
+# answers that are errors only for some commands: 'phone' for unknown contact answers the same but succeeds
+COMMAND_ERROR_PREFIXES = {
+    "add-birthday": ("There is no ",),
+}
+
+#--------------------------------------------------- TRACES -----------------------------------------------------------------------
+def read_trace(path):
+    """
+    Returns (setup lines, {session: [(t, line), ...]}) from trace file
+    """
+    setup = []
+    sessions = {}
+    with open(path, encoding="utf-8") as trace:
+        for line in trace:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("setup"):
+                setup.append(entry["line"])
+            else:
+                sessions.setdefault(entry["session"], []).append((entry["t"], entry["line"]))
+    return setup, sessions
+
+
+def synthetic_command(rnd, contacts, write_ratio):
+    """
+    One command line: reads look contacts up, writes add phones, contacts and birthdays or change phones
+    """
+    name, phones, _ = rnd.choice(contacts)
+    if rnd.random() < write_ratio:
+        choice = rnd.random()
+        if choice < 0.4:
+            phone = f"0{rnd.randrange(10**9):09d}"
+            phones.append(phone)
+            return f"add {name} {phone}"
+        if choice < 0.6 and phones:
+            old_phone = rnd.choice(phones)
+            new_phone = f"0{rnd.randrange(10**9):09d}"
+            phones[phones.index(old_phone)] = new_phone
+            return f"change {name} {old_phone} {new_phone}"
+        if choice < 0.8:
+            return f"add-birthday {name} {rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(1950, 2010)}"
+        new_name = f"Guest{rnd.randrange(10**6)}"
+        phone = f"0{rnd.randrange(10**9):09d}"
+        contacts.append((new_name, [phone], None))
+        return f"add {new_name} {phone}"
+    choice = rnd.random()
+    if choice < 0.35:
+        return f"phone {name}"
+    if choice < 0.55:
+        return f"who {rnd.choice(phones)}" if phones else f"phone {name}"
+    if choice < 0.7:
+        return f"search {name[:3]}"
+    if choice < 0.8:
+        return f"show-birthday {name}"
+    if choice < 0.9:
+        return f"birthdays {rnd.choice([7, 7, 7, 30])}"
+    return f"all {rnd.randint(1, 5)} 20"
+
+
+def generate(options):
+    rnd = random.Random(options.seed)
+    contacts = [(name, list(phones), birthday) for name, phones, birthday in generate_contacts(options.contacts, options.seed)]
+    entries = []
+    for name, phones, birthday in contacts:
+        for phone in phones:
+            entries.append({"t": 0, "session": 0, "line": f"add {name} {phone}", "setup": True})
+        if birthday is not None:
+            entries.append({"t": 0, "session": 0, "line": f"add-birthday {name} {birthday}", "setup": True})
+
+    commands = []
+    for session in range(1, options.sessions + 1):
+        moment = rnd.uniform(0, options.ramp)
+        for _ in range(options.commands):
+            commands.append({"t": round(moment, 6), "session": session, "line": synthetic_command(rnd, contacts, options.write_ratio)})
+            moment += rnd.expovariate(1 / options.think) if options.think else 0
+    commands.sort(key=lambda entry: entry["t"])
+
+    with open(options.output, "w", encoding="utf-8") as trace:
+        for entry in entries + commands:
+            trace.write(json.dumps(entry) + "\n")
+    print(f"{len(commands)} commands in {options.sessions} sessions (+{len(entries)} setup lines) written to {options.output}")
+
+#--------------------------------------------------- REPLAY -----------------------------------------------------------------------
+class Pacer:
+    """
+    Decides when each command is sent: at trace time divided by speed, at fixed total rate, or at once (speed 0)
+    """
+    def __init__(self, speed, rate):
+        self.speed = speed
+        self.rate = rate
+        self.started = time.perf_counter()
+        self._next_slot = self.started
+        self._lock = threading.Lock()
+
+    def delay(self, moment):
+        now = time.perf_counter()
+        if self.rate:
+            with self._lock:
+                self._next_slot = max(self._next_slot + 1 / self.rate, now)
+                return self._next_slot - now
+        if self.speed:
+            return self.started + moment / self.speed - now
+        return 0
+
+    def wait(self, moment):
+        delay = self.delay(moment)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def async_wait(self, moment):
+        delay = self.delay(moment)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def error_key(message):
+    # numbers differ from one failure to another, the kind of failure does not
+    return re.sub(r"\d+", "N", message)
+
+
+def replay_in_process(setup, sessions, options):
+    book = AddressBook()
+    if options.concurrency > 1:
+        book.make_thread_safe()
+    setup_session = BotSession(book)
+    for line in setup:
+        _, result = setup_session.handle(line)
+        for _ in output_chunks(result):
+            pass
+
+    pacer = Pacer(options.speed, options.rate)
+
+    def run_session(lines):
+        session = BotSession(book)
+        measured = []
+        for moment, line in lines:
+            pacer.wait(moment)
+            started = time.perf_counter()
+            command, result = session.handle(line)
+            error = str(result) if isinstance(result, ErrorMessage) else None
+            for _ in output_chunks(result):
+                pass # streamed answers are rendered while being read, that's part of the latency
+            measured.append((command, time.perf_counter() - started, error))
+        return measured
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+        results = list(pool.map(run_session, sessions.values()))
+    return [entry for measured in results for entry in measured], time.perf_counter() - started
+
+
+async def replay_over_socket(setup, sessions, options):
+    if options.socket:
+        connect = lambda: asyncio.open_unix_connection(options.socket, limit=2**24)
+    else:
+        host, _, port = options.connect.rpartition(":")
+        connect = lambda: asyncio.open_connection(host or "127.0.0.1", int(port), limit=2**24)
+
+    async def ask(reader, writer, line):
+        # empty line after the command is answered with empty line, which marks the end of the answer
+        writer.write(line.encode("utf-8") + b"\n\n")
+        await writer.drain()
+        answer = []
+        while True:
+            response = await reader.readline()
+            if not response or response == b"\n":
+                return answer
+            answer.append(response.decode("utf-8").rstrip("\n"))
+
+    async def run_session(lines, pacer=None, semaphore=None):
+        measured = []
+        async with semaphore or asyncio.Semaphore(1):
+            reader, writer = await connect()
+            welcome = await reader.readline()
+            if welcome.startswith(b"Server is busy"):
+                writer.close()
+                return [(parse_input(line)[0], 0.0, "Server is busy") for _, line in lines]
+            for moment, line in lines:
+                if pacer is not None:
+                    await pacer.async_wait(moment)
+                started = time.perf_counter()
+                answer = await ask(reader, writer, line)
+                first = answer[0] if answer else ""
+                command = parse_input(line)[0]
+                prefixes = ERROR_PREFIXES + COMMAND_ERROR_PREFIXES.get(command, ())
+                error = first if first.startswith(prefixes) else None
+                measured.append((command, time.perf_counter() - started, error))
+                if reader.at_eof():
+                    break # 'exit' closes the connection
+            writer.close()
+        return measured
+
+    if setup:
+        await run_session([(0, line) for line in setup])
+    pacer = Pacer(options.speed, options.rate)
+    semaphore = asyncio.Semaphore(options.concurrency)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_session(lines, pacer, semaphore) for lines in sessions.values()))
+    return [entry for measured in results for entry in measured], time.perf_counter() - started
+
+#--------------------------------------------------- REPORT -----------------------------------------------------------------------
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def build_report(measured, seconds):
+    by_command = {}
+    errors = Counter()
+    for command, latency, error in measured:
+        entry = by_command.setdefault(command, {"latencies": [], "errors": 0})
+        entry["latencies"].append(latency)
+        if error is not None:
+            entry["errors"] += 1
+            errors[error_key(error)] += 1
+    commands = {}
+    for command, entry in sorted(by_command.items(), key=lambda item: -len(item[1]["latencies"])):
+        latencies = sorted(entry["latencies"])
+        commands[command] = {
+            "count": len(latencies),
+            "errors": entry["errors"],
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+        }
+    total_errors = sum(errors.values())
+    return {
+        "commands": len(measured),
+        "seconds": round(seconds, 3),
+        "throughput": round(len(measured) / seconds, 1) if seconds else None,
+        "error_rate": round(total_errors / len(measured), 4) if measured else 0,
+        "per_command": commands,
+        "errors": dict(errors.most_common()),
+    }
+
+
+def print_report(report):
+    print(f"{report['commands']} commands in {report['seconds']} s, {report['throughput']} commands/s, "
+          f"error rate {report['error_rate'] * 100:.2f}%")
+    print(f"{'command':<15}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for command, numbers in report["per_command"].items():
+        print(f"{str(command):<15}{numbers['count']:>8}{numbers['errors']:>8}{numbers['p50_ms']:>10}"
+              f"{numbers['p95_ms']:>10}{numbers['p99_ms']:>10}{numbers['max_ms']:>10}")
+    if report["errors"]:
+        print("errors:")
+        for message, count in report["errors"].items():
+            print(f"{count:>8}  {message}")
+
+
+def replay(options):
+    setup, sessions = read_trace(options.trace)
+    if options.connect or options.socket:
+        measured, seconds = asyncio.run(replay_over_socket(setup, sessions, options))
+    else:
+        measured, seconds = replay_in_process(setup, sessions, options)
+    report = build_report(measured, seconds)
+    print_report(report)
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    generating = subparsers.add_parser("generate", help="write synthetic trace")
+    generating.add_argument("--sessions", type=int, default=50)
+    generating.add_argument("--commands", type=int, default=200, help="commands per session")
+    generating.add_argument("--write-ratio", type=float, default=0.2, help="share of commands changing the book")
+    generating.add_argument("--contacts", type=int, default=1000, help="contacts added by setup lines")
+    generating.add_argument("--think", type=float, default=0.05, help="mean pause between commands of a session, seconds")
+    generating.add_argument("--ramp", type=float, default=1.0, help="sessions start within this many seconds")
+    generating.add_argument("--seed", type=int, default=2024)
+    generating.add_argument("--output", default="trace.jsonl")
+
+    replaying = subparsers.add_parser("replay", help="replay trace and report")
+    replaying.add_argument("trace")
+    replaying.add_argument("--concurrency", type=int, default=10, help="sessions replayed at the same time")
+    replaying.add_argument("--speed", type=float, default=1.0, help="trace time multiplier, 0 sends commands without pauses")
+    replaying.add_argument("--rate", type=float, default=0, help="fixed total commands per second instead of trace timing")
+    replaying.add_argument("--connect", metavar="HOST:PORT", help="replay against bot started with --serve")
+    replaying.add_argument("--socket", metavar="PATH", help="replay against bot started with --socket")
+    replaying.add_argument("--json", metavar="PATH", help="also write report as JSON")
+
+    options = parser.parse_args()
+    if options.action == "generate":
+        generate(options)
+    else:
+        replay(options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Memory regression guard: builds a seeded synthetic book and checks bytes per contact
+(AddressBook.memory_usage deep size by field type and tracemalloc of the whole build)
+against support/memory_thresholds.json. Exits with 1 when anything grew more than the tolerance,
+so it can run next to the rest of the checks.
+
+Run from the repository root:
+    python support/memory_guard.py [--tolerance 0.05]
+    python support/memory_guard.py --update    # accept current numbers as new thresholds
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark import build_book
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(__file__), "memory_thresholds.json")
+
+
+def measure(contacts, seed):
+    """
+    Bytes per contact: deep size in total and by field type, and traced allocations of building the book
+    """
+    tracemalloc.start()
+    book = build_book(contacts, seed)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    usage = book.memory_usage()
+    numbers = {"deep_total": usage["bytes_per_contact"], "traced_total": round(traced / contacts, 1)}
+    for field_type, size in usage["by_type"].items():
+        numbers[f"deep_{field_type}"] = round(size / contacts, 1)
+    return numbers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contacts", type=int, help="book size, the one thresholds were taken with by default (20000)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--tolerance", type=float, default=0.05, help="allowed growth, 0.05 is 5%%")
+    parser.add_argument("--update", action="store_true", help="write current numbers to the thresholds file")
+    options = parser.parse_args()
+
+    saved = {"contacts": 20000, "seed": 2024, "bytes_per_contact": {}}
+    if os.path.exists(THRESHOLDS_FILE):
+        with open(THRESHOLDS_FILE, encoding="utf-8") as thresholds_file:
+            saved = json.load(thresholds_file)
+    # per-contact numbers depend a bit on book size, so by default the book is the same as for thresholds
+    contacts = options.contacts or saved["contacts"]
+    seed = options.seed if options.seed is not None else saved["seed"]
+    numbers = measure(contacts, seed)
+
+    if options.update or not saved["bytes_per_contact"]:
+        with open(THRESHOLDS_FILE, "w", encoding="utf-8") as thresholds_file:
+            json.dump({"contacts": contacts, "seed": seed, "bytes_per_contact": numbers}, thresholds_file, indent=2)
+            thresholds_file.write("\n")
+        print(f"thresholds written to {THRESHOLDS_FILE}")
+        return 0
+
+    thresholds = saved["bytes_per_contact"]
+    failed = 0
+    print(f"{'bytes per contact':<20}{'now':>10}{'limit':>10}")
+    for name, value in numbers.items():
+        limit = thresholds.get(name)
+        if limit is None:
+            print(f"{name:<20}{value:>10}{'-':>10}")
+            continue
+        allowed = limit * (1 + options.tolerance)
+        status = "" if value <= allowed else "  TOO BIG"
+        failed += bool(status)
+        print(f"{name:<20}{value:>10}{limit:>10}{status}")
+    if failed:
+        print(f"{failed} numbers grew more than {options.tolerance * 100:.0f}%, "
+              f"fix it or accept with --update")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
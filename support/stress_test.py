@@ -0,0 +1,95 @@
+"""
+Hammers bot command handlers from many threads over one shared AddressBook.
+With locking on (default) it must finish without errors and leave indexes consistent,
+with --unsafe it shows what happens to a book without locks.
+
+Run from the repository root:
+    python support/stress_test.py [--threads 16] [--commands 2000] [--unsafe]
+"""
+import argparse
+import os
+import random
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from task_integration import AddressBook, execute, output_chunks
+
+
+def random_command(rnd):
+    name = f"user{rnd.randint(0, 500)}"
+    phone = f"{rnd.randint(0, 2000):010d}"
+    choice = rnd.random()
+    if choice < 0.25:
+        return "add", [name, phone]
+    if choice < 0.35:
+        return "add-birthday", [name, f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.1990"]
+    if choice < 0.45:
+        return "change", [name, phone, f"{rnd.randint(0, 2000):010d}"]
+    if choice < 0.6:
+        return "phone", [name]
+    if choice < 0.7:
+        return "who", [phone]
+    if choice < 0.85:
+        return "all", []
+    return "birthdays", []
+
+
+def worker(book, seed, commands):
+    rnd = random.Random(seed)
+    for _ in range(commands):
+        command, args = random_command(rnd)
+        # lazy output ("all") is read only here, so it has to be consumed to be tested
+        for _ in output_chunks(execute(command, args, book)):
+            pass
+
+
+def check_indexes(book):
+    """
+    Every phone and birthday of every record must be found through the indexes
+    """
+    problems = 0
+    for name, record in book.data.items():
+        for phone in record.phones:
+            if record not in book.find_by_phone(phone.value):
+                problems += 1
+        if record.birthday is not None:
+            month_day = (record.birthday.value.month, record.birthday.value.day)
+            if name not in book._birthday_index.get(month_day, {}):
+                problems += 1
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--commands", type=int, default=2000, help="commands per thread")
+    parser.add_argument("--unsafe", action="store_true", help="run without reader/writer locking")
+    options = parser.parse_args()
+
+    # switch threads often to make races show up quickly
+    sys.setswitchinterval(1e-6)
+    book = AddressBook()
+    if not options.unsafe:
+        book.make_thread_safe()
+
+    errors = 0
+    with ThreadPoolExecutor(max_workers=options.threads) as pool:
+        futures = [pool.submit(worker, book, seed, options.commands) for seed in range(options.threads)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                errors += 1
+                traceback.print_exc(limit=2)
+
+    problems = check_indexes(book)
+    print(f"threads: {options.threads}, commands: {options.threads * options.commands}, contacts: {len(book)}")
+    print(f"crashed threads: {errors}, index problems: {problems}")
+    return 1 if errors or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,291 @@
+import argparse
+import asyncio
+import bisect
+import csv
 import functools
-from collections import UserDict
+import gzip
+import heapq
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+from collections import UserDict, deque, namedtuple
+from collections.abc import MutableMapping
+from contextlib import contextmanager
 from datetime import datetime, timedelta, date
 
+try:
+    import numpy as np
+except ImportError: # optional, only needed for AddressBook.enable_vectorized_birthdays()
+    np = None
+
+class ReadWriteLock:
+    """
+    Lets many readers or one writer in at a time.
+    Waiting writer blocks new readers, so constant reads can't starve writes. Not reentrant.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+    def release_write(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+class NameIndex:
+    """
+    Contact names sorted by casefolded form, for prefix and typo-tolerant search.
+    New names wait in a list and get merged on the next query, so bulk loads don't pay for sorted inserts.
+    """
+    def __init__(self):
+        self._keys = [] # sorted (casefolded name, name)
+        self._pending = []
+        self._merge_lock = threading.Lock() # queries merge pending names and may run in parallel
+
+    def add(self, name):
+        self._pending.append((name.casefold(), name))
+
+    def remove(self, name):
+        self._merge()
+        key = (name.casefold(), name)
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+
+    def _merge(self):
+        if self._pending:
+            with self._merge_lock:
+                if self._pending:
+                    self._keys.extend(self._pending)
+                    self._keys.sort() # timsort merges sorted run with the new tail in linear time
+                    self._pending = []
+
+    def __len__(self):
+        return len(self._keys) + len(self._pending)
+
+    def page(self, offset, size):
+        """
+        size names in sorted order starting from offset
+        """
+        self._merge()
+        return [name for _, name in self._keys[offset:offset + size]]
+
+    def after(self, name, size):
+        """
+        size names in sorted order going after name (name itself may be not in the index)
+        """
+        self._merge()
+        position = bisect.bisect_right(self._keys, (name.casefold(), name))
+        return [name for _, name in self._keys[position:position + size]]
+
+    def prefix(self, fragment):
+        """
+        Names starting with fragment, O(log n + matches)
+        """
+        self._merge()
+        folded = fragment.casefold()
+        position = bisect.bisect_left(self._keys, (folded,))
+        found = []
+        while position < len(self._keys) and self._keys[position][0].startswith(folded):
+            found.append(self._keys[position][1])
+            position += 1
+        return found
+
+    def fuzzy(self, fragment, max_distance):
+        """
+        Names within max_distance edits (Levenshtein) from fragment, closest first.
+        Sorted keys are walked like a trie: edit distance rows are shared by names with common prefix,
+        and whole prefix ranges are skipped as soon as no name in them can be close enough.
+        """
+        self._merge()
+        target = fragment.casefold()
+        rows = [list(range(len(target) + 1))] # rows[i] is distance row for current[:i]
+        current = ""
+        found = []
+        position = 0
+        while position < len(self._keys):
+            key, name = self._keys[position]
+            common = 0
+            while common < len(current) and common < len(key) and current[common] == key[common]:
+                common += 1
+            del rows[common + 1:]
+            current = key[:common]
+
+            pruned = False
+            for char in key[common:]:
+                previous_row = rows[-1]
+                row = [previous_row[0] + 1]
+                for column, target_char in enumerate(target, start=1):
+                    row.append(min(row[column - 1] + 1, previous_row[column] + 1, previous_row[column - 1] + (char != target_char)))
+                rows.append(row)
+                current += char
+                if min(row) > max_distance:
+                    pruned = True
+                    break
+            if pruned:
+                # every name starting with current is too far, jump past all of them
+                position = bisect.bisect_left(self._keys, (current + "\U0010ffff",), position)
+                continue
+            if rows[-1][-1] <= max_distance:
+                found.append((rows[-1][-1], key, name))
+            position += 1
+        return [name for _, _, name in sorted(found)]
+
+class BirthdayColumns:
+    """
+    Birthdays of the whole book as NumPy columns, so congratulation list for millions of contacts
+    is computed in a few array operations instead of a Python loop. Rows of removed birthdays are reused.
+    """
+    EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+    def __init__(self, capacity=1024):
+        self._months = np.zeros(capacity, np.int64)
+        self._days = np.zeros(capacity, np.int64)
+        self._ordinals = np.zeros(capacity, np.int64) # original birthday, for the output
+        self._positions = np.zeros(capacity, np.int64) # book order, for equal congratulation dates
+        self._alive = np.zeros(capacity, bool)
+        self._names = [None] * capacity
+        self._rows = {} # contact name -> row
+        self._free = []
+        self._size = 0
+
+    def _new_row(self):
+        if self._size == len(self._alive):
+            grow = len(self._alive)
+            self._months = np.concatenate([self._months, np.zeros(grow, np.int64)])
+            self._days = np.concatenate([self._days, np.zeros(grow, np.int64)])
+            self._ordinals = np.concatenate([self._ordinals, np.zeros(grow, np.int64)])
+            self._positions = np.concatenate([self._positions, np.zeros(grow, np.int64)])
+            self._alive = np.concatenate([self._alive, np.zeros(grow, bool)])
+            self._names.extend([None] * grow)
+        self._size += 1
+        return self._size - 1
+
+    def set(self, name, birthday, position):
+        row = self._rows.get(name)
+        if row is None:
+            row = self._free.pop() if self._free else self._new_row()
+            self._rows[name] = row
+        self._months[row] = birthday.month
+        self._days[row] = birthday.day
+        self._ordinals[row] = birthday.toordinal()
+        self._positions[row] = position
+        self._alive[row] = True
+        self._names[row] = name
+
+    def remove(self, name):
+        row = self._rows.pop(name, None)
+        if row is not None:
+            self._alive[row] = False
+            self._names[row] = None
+            self._free.append(row)
+
+    @staticmethod
+    def _days_in_year(year, months, days):
+        # dates as days since 1970-01-01, Feb 29 of a common year rolls over to Mar 1 (callers check it first)
+        month_numbers = (year - 1970) * 12 + months - 1
+        return month_numbers.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + days - 1
+
+    def upcoming(self, today, days):
+        """
+        Same list get_upcoming_birthdays builds: birthdays moved off weekends within next days, sorted
+        """
+        rows = np.flatnonzero(self._alive[:self._size])
+        months, month_days = self._months[rows], self._days[rows]
+        today_number = today.toordinal() - self.EPOCH_ORDINAL
+
+        this_year = self._days_in_year(today.year, months, month_days)
+        next_year = self._days_in_year(today.year + 1, months, month_days)
+        dates = np.where(this_year < today_number, next_year, this_year)
+        weekdays = (dates + 3) % 7 # 1970-01-01 was Thursday
+        dates = dates + np.where(weekdays == 5, 2, np.where(weekdays == 6, 1, 0))
+        hit = (dates >= today_number) & (dates - today_number <= days)
+        rows, dates = rows[hit], dates[hit]
+
+        # congratulation dates are compared as DD.MM.YYYY strings, so sort by day, month, year, then book order
+        calendar = dates.astype("datetime64[D]")
+        month_starts = calendar.astype("datetime64[M]")
+        years = calendar.astype("datetime64[Y]")
+        day_numbers = (calendar - month_starts).astype(np.int64)
+        month_numbers = (month_starts - years.astype("datetime64[M]")).astype(np.int64)
+        order = np.lexsort((self._positions[rows], years.astype(np.int64), month_numbers, day_numbers))
+
+        return [
+            {
+                "name": self._names[row],
+                "original_birthday": date.fromordinal(int(self._ordinals[row])).strftime("%d.%m.%Y"),
+                "congratulation_date": date.fromordinal(congratulation + self.EPOCH_ORDINAL).strftime("%d.%m.%Y")
+            }
+            for row, congratulation in zip(rows[order].tolist(), dates[order].tolist())
+        ]
+
+DATE_PATTERN = re.compile(r"([0-9]{1,2})\.([0-9]{1,2})\.([0-9]{4})")
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(value):
+    """
+    DD.MM.YYYY string to date with the same rules as datetime.strptime(value, '%d.%m.%Y'), several times faster.
+    Results are cached, bulk loads repeat the same dates a lot
+    """
+    match = DATE_PATTERN.fullmatch(value)
+    if match is None:
+        # forms strptime may still accept (like ' 1.02.2000') or reject, let it decide
+        return datetime.strptime(value, '%d.%m.%Y').date()
+    day, month, year = match.groups()
+    return date(int(year), int(month), int(day))
+
 class Field:
+    __slots__ = ("__value",) # no per-instance __dict__, contacts are kept in large numbers
+
     def __init__(self,value):
         self.__value = value.strip()
 
@@ -17,18 +300,30 @@ class Field:
     def __str__(self):
         return str(self.value)
 
+    @classmethod
+    def from_value(cls, value):
+        """
+        Creates field from already validated value (e.g. read from snapshot), skipping parsing and checks
+        """
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
 class Name(Field):
-    pass
+    __slots__ = ()
 
 class Birthday(Field):
+    __slots__ = ()
+
     def __init__(self, value):
         try:
-            formatted_string = '%d.%m.%Y'
-            self.value = datetime.strptime(value,formatted_string).date()
+            self.value = parse_date(value)
         except ValueError:
             raise ValueError("Invalid date format. Use DD.MM.YYYY format for real calendar dates")
 
 class Phone(Field):
+   __slots__ = ()
+
    def __init__(self,value):
 
         if isinstance(value, str) and value.isdigit() and len(value) == 10:
@@ -38,20 +333,47 @@ class Phone(Field):
 
 
 class Record:
+    __slots__ = ("name", "phones", "birthday", "book")
+
     def __init__(self, name):
         self.name = Name(name)
         self.phones = []
         self.birthday = None
+        self.book = None # AddressBook this record belongs to, set by AddressBook.add_record
+
+    def _will_change(self):
+        # Lets the owning book remember this record before a change it may have to undo
+        if self.book is not None:
+            self.book._record_will_change(self)
+
+    def _notify(self, action, *args):
+        # Lets the owning book keep its indexes in sync with this record
+        if self.book is not None:
+            self.book._record_changed(self, action, *args)
+
+    def __getstate__(self):
+        # the owning book stays behind, otherwise pickling one record would pickle the whole book
+        return self.name, self.phones, self.birthday
+
+    def __setstate__(self, state):
+        self.name, self.phones, self.birthday = state
+        self.book = None
 
     def add_birthday(self, birhday_string):
-        self.birthday = Birthday(birhday_string)
+        previous_birthday = self.birthday
+        birthday = Birthday(birhday_string)
+        self._will_change()
+        self.birthday = birthday
+        self._notify("add_birthday", previous_birthday)
 
     def show_birthday(self):
         return self.birthday
 
     def add_phone(self,phone_number):
         phone_num_act = Phone(phone_number)
+        self._will_change()
         self.phones.append(phone_num_act)
+        self._notify("add_phone", phone_num_act.value)
     
     def find_phone(self, phone):
         for phone_obj in self.phones:
@@ -62,14 +384,18 @@ class Record:
 
         phone_obj_to_edit = self.find_phone(old_phone)
         if phone_obj_to_edit:
+            self._will_change()
             phone_obj_to_edit.value = new_phone
+            self._notify("edit_phone", old_phone, new_phone)
         else:
             raise ValueError(f"Phone number '{old_phone}' not found for editing within '{self.name}' record")
     
     def remove_phone(self, phone_num):
         phone_obj_to_remove = self.find_phone(phone_num)
         if phone_obj_to_remove:
+            self._will_change()
             self.phones.remove(phone_obj_to_remove)
+            self._notify("remove_phone", phone_num)
         else:
             raise ValueError(f"Phone number '{phone_num}' not found in record for {self.name}.")
 
@@ -80,81 +406,1952 @@ class Record:
         else:
             return f"Contact name: {self.name.value}, phones: {'; '.join(p.value for p in self.phones)}, bithday: {self.birthday}"
 
+def deep_sizeof(obj, seen):
+    """
+    Size of object with everything it references (containers, __slots__ and __dict__ attributes),
+    objects whose id is in seen are skipped, so shared ones are counted once
+    """
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, date)):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(deep_sizeof(item, seen) for item in obj)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            if slot.startswith("__") and not slot.endswith("__"):
+                slot = f"_{cls.__name__}{slot}" # name mangled private slot
+            size += deep_sizeof(getattr(obj, slot, None), seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+class BookBatch:
+    """
+    State of an open AddressBook.batch(): contacts as they were before it, and changes to journal at commit
+    """
+    def __init__(self):
+        self.saved = {} # name -> (Record or None if there was no such contact, phones, birthday, position)
+        self.dirty = {} # name -> (phones, birthday) the indexes still hold for it, None if they don't know it
+        self.changes = [] # (action, name, args) in journal format
+
+    def remember(self, book, name):
+        if name in self.dirty:
+            return # indexes and saved state are from before the first change
+        record = book.data.get(name)
+        state = None if record is None else ([phone.value for phone in record.phones], record.birthday)
+        self.dirty[name] = state
+        if name in self.saved:
+            return # indexes were brought up to date in the middle of the batch, undo keeps the first state
+        if record is None:
+            self.saved[name] = (None, None, None, None)
+        else:
+            self.saved[name] = (record, *state, book._positions[name])
+
 class AddressBook(UserDict):
+        def __init__(self, *args, **kwargs):
+            # phone number -> {contact name: Record}, one number may be shared by several contacts
+            self._phone_index = {}
+            # (month, day) -> {contact name: Record}, lets birthday queries visit only the days asked for
+            self._birthday_index = {}
+            # contact name -> insertion number, keeps the book order for equal birthday dates
+            self._positions = {}
+            self._next_position = itertools.count()
+            self.journal = None # Journal that persists every change, see open_book()
+            self.feed = None # ChangeFeed publishing every change, see enable_change_feed()
+            self.lock = None # ReadWriteLock when the book is shared between threads, see make_thread_safe()
+            self._names = NameIndex()
+            self._birthday_columns = None # BirthdayColumns, see enable_vectorized_birthdays()
+            self.version = 0 # bumped by every change of the book or its records, keys cached results
+            self._upcoming_cache = None # ((version, today, days), result) of the last get_upcoming_birthdays
+            self._batch = None # BookBatch of the open transaction, see batch()
+            super().__init__(*args, **kwargs)
+
+        def __setitem__(self, name, record):
+            batch = self._batch
+            if batch is not None:
+                batch.remember(self, name)
+            previous = self.data.get(name)
+            if previous is not None and previous is not record:
+                if batch is None:
+                    self._unindex_record(previous)
+                else:
+                    previous.book = None
+            if previous is None:
+                self._positions[name] = next(self._next_position)
+            self.data[name] = record
+            record.book = self
+            # inside a batch indexes catch up once, see _sync_indexes()
+            if batch is None:
+                if previous is None:
+                    self._names.add(name)
+                self._index_record(record)
+                self.version += 1
+            if self.journal is not None or self.feed is not None:
+                self._log_change("add_record", name, [phone.value for phone in record.phones], format_birthday(record.birthday))
+
+        def __delitem__(self, name):
+            if self._batch is not None and name in self.data:
+                self._batch.remember(self, name)
+            record = self.data.pop(name)
+            del self._positions[name]
+            if self._batch is None:
+                self._names.remove(name)
+                self._unindex_record(record)
+                self.version += 1
+            else:
+                record.book = None
+            self._log_change("delete", name)
+
+        def _log_change(self, action, name, *args):
+            # args are in journal format: phone strings and birthday as DD.MM.YYYY
+            if self._batch is not None:
+                if self.journal is not None or self.feed is not None:
+                    self._batch.changes.append((action, name, args))
+                return
+            if self.journal is not None:
+                self.journal.write(action, name, *args)
+            if self.feed is not None:
+                self.feed.publish(action, name, *args)
+
+        @classmethod
+        def from_snapshot(cls, path):
+            """
+            Opens book over binary snapshot, records are decoded only when touched
+            """
+            book = cls()
+            snapshot = BookSnapshot(path)
+            book.data = LazyRecords(snapshot, book)
+            book._next_position = itertools.count(len(snapshot))
+            return book
+
+        @contextmanager
+        def batch(self):
+            """
+            Transaction: changes made inside the with block are kept all or nothing.
+            If the block raises, every touched contact is put back as it was and the error goes on.
+            Indexes, name index and version catch up once per touched contact at commit (or before
+            a query inside the block needs them), journal and change feed get the changes at commit
+            (one fsync for all of them).
+            Nested batch() joins the outer one. Threads sharing the book must hold lock.writing() around it
+            """
+            if self._batch is not None:
+                yield self
+                return
+            self._load_all()
+            batch = self._batch = BookBatch()
+            try:
+                yield self
+            except BaseException:
+                self._batch = None
+                self._rollback(batch)
+                raise
+            self._sync_indexes()
+            self._batch = None
+            self._flush_changes(batch.changes)
+
+        def _record_will_change(self, record):
+            if self._batch is not None:
+                self._batch.remember(self, record.name.value)
+
+        def _rollback(self, batch):
+            # goes around __setitem__ / __delitem__, putting things back is not a change to journal
+            moved = False # a contact deleted in the batch is put back at the end of data
+            for name, (record, phones, birthday, position) in batch.saved.items():
+                current = self.data.get(name)
+                if name in batch.dirty:
+                    indexed = batch.dirty[name]
+                else:
+                    # indexes caught up in the middle of the batch and the contact did not change since
+                    indexed = None if current is None else ([phone.value for phone in current.phones], current.birthday)
+                if record is not None and self._positions.get(name) != position:
+                    moved = True
+                if current is not None and current is not record:
+                    current.book = None
+                if record is None:
+                    if current is not None:
+                        del self.data[name]
+                        del self._positions[name]
+                else:
+                    # Phone objects may have been edited in place, so they are made anew
+                    record.phones = [Phone.from_value(phone) for phone in phones]
+                    record.birthday = birthday
+                    if current is not record:
+                        self.data[name] = record
+                    self._positions[name] = position
+                    record.book = self
+                # without queries inside the batch indexes never saw its changes and there is nothing to undo
+                if indexed != (None if record is None else (phones, birthday)):
+                    self._reindex(name, indexed, record)
+            if moved:
+                self._restore_order()
+            self.version += 1
+
+        def _sync_indexes(self):
+            # brings indexes up to date with changes made so far in the open batch
+            batch = self._batch
+            if batch is None or not batch.dirty:
+                return
+            for name, indexed in batch.dirty.items():
+                self._reindex(name, indexed, self.data.get(name))
+            batch.dirty.clear()
+            self.version += 1
+
+        def _reindex(self, name, indexed, record):
+            # indexes hold (phones, birthday) indexed for name (None: nothing), make them hold record (None: gone)
+            if indexed is not None:
+                self._unindex_values(name, *indexed)
+            if record is not None:
+                self._index_record(record)
+            if indexed is None and record is not None:
+                self._names.add(name)
+            elif indexed is not None and record is None:
+                self._names.remove(name)
+
+        def _restore_order(self):
+            # book order is the order of positions, they only grow as contacts are added
+            if isinstance(self.data, LazyRecords):
+                self.data.reorder(self._positions)
+                return
+            ordered = sorted(self.data.items(), key=lambda item: self._positions[item[0]])
+            self.data.clear()
+            self.data.update(ordered)
+
+        def _flush_changes(self, changes):
+            if self.journal is not None:
+                self.journal.write_many(changes)
+            if self.feed is not None:
+                for action, name, args in changes:
+                    self.feed.publish(action, name, *args)
+
+        def enable_change_feed(self, capacity=10_000):
+            """
+            Starts publishing every change of the book to ChangeFeed keeping last capacity events, returns the feed
+            """
+            self.feed = ChangeFeed(capacity)
+            return self.feed
+
+        def make_thread_safe(self):
+            """
+            Turns on reader/writer locking: bot commands reading the book run in parallel, changing ones one at a time.
+            Code using the book directly from several threads should wrap calls in lock.reading() / lock.writing()
+            """
+            # decoding lazily opened records changes indexes, which parallel readers must not see
+            self._load_all()
+            self.lock = ReadWriteLock()
+            return self
+
+        def _attach(self, record, position):
+            # Record just decoded from a lazily opened snapshot
+            self._positions[record.name.value] = position
+            self._names.add(record.name.value)
+            record.book = self
+            self._index_record(record)
+
+        def _load_all(self):
+            # Whole-book indexes only know decoded records, lazily opened books decode the rest first
+            if isinstance(self.data, LazyRecords):
+                self.data.load_all()
+            self._sync_indexes()
+
+        def _index_record(self, record):
+            for phone in record.phones:
+                self._phone_index.setdefault(phone.value, {})[record.name.value] = record
+            if record.birthday is not None:
+                self._index_birthday(record, record.birthday)
+
+        def _unindex_record(self, record):
+            self._unindex_values(record.name.value, [phone.value for phone in record.phones], record.birthday)
+            record.book = None
+
+        def _unindex_values(self, name, phones, birthday):
+            for phone in phones:
+                owners = self._phone_index.get(phone)
+                if owners is not None:
+                    owners.pop(name, None)
+                    if not owners:
+                        del self._phone_index[phone]
+            if birthday is not None:
+                self._unindex_birthday(name, birthday)
+
+        def _index_birthday(self, record, birthday):
+            month_day = (birthday.value.month, birthday.value.day)
+            self._birthday_index.setdefault(month_day, {})[record.name.value] = record
+            if self._birthday_columns is not None:
+                self._birthday_columns.set(record.name.value, birthday.value, self._positions[record.name.value])
+
+        def _unindex_birthday(self, name, birthday):
+            month_day = (birthday.value.month, birthday.value.day)
+            bucket = self._birthday_index.get(month_day)
+            if bucket is not None:
+                bucket.pop(name, None)
+                if not bucket:
+                    del self._birthday_index[month_day]
+            if self._birthday_columns is not None:
+                self._birthday_columns.remove(name)
+
+        def enable_vectorized_birthdays(self):
+            """
+            Moves get_upcoming_birthdays to NumPy columns, worth it for books with millions of birthdays.
+            Returns False and keeps the pure Python path when NumPy is not installed
+            """
+            if np is None:
+                return False
+            self._load_all()
+            columns = BirthdayColumns()
+            for bucket in self._birthday_index.values():
+                for name, record in bucket.items():
+                    columns.set(name, record.birthday.value, self._positions[name])
+            self._birthday_columns = columns
+            return True
+
+        def _unindex_phone(self, record, phone):
+            if record.find_phone(phone) is not None:
+                return # record still keeps another copy of this number
+            owners = self._phone_index.get(phone)
+            if owners is not None:
+                owners.pop(record.name.value, None)
+                if not owners:
+                    del self._phone_index[phone]
+
+        def _record_changed(self, record, action, *args):
+            """
+            Called by Record after every change so indexes stay up to date
+            """
+            if self._batch is not None:
+                pass # the batch brings indexes up to date once, see _sync_indexes()
+            elif action == "add_phone":
+                phone, = args
+                self._phone_index.setdefault(phone, {})[record.name.value] = record
+            elif action == "edit_phone":
+                old_phone, new_phone = args
+                self._unindex_phone(record, old_phone)
+                self._phone_index.setdefault(new_phone, {})[record.name.value] = record
+            elif action == "remove_phone":
+                phone, = args
+                self._unindex_phone(record, phone)
+            elif action == "add_birthday":
+                previous_birthday, = args
+                if previous_birthday is not None:
+                    self._unindex_birthday(record.name.value, previous_birthday)
+                self._index_birthday(record, record.birthday)
+            if self._batch is None:
+                self.version += 1
+
+            if action == "add_birthday":
+                self._log_change(action, record.name.value, format_birthday(record.birthday))
+            else:
+                self._log_change(action, record.name.value, *args)
+
         def add_record(self, record):
             if isinstance(record, Record):
-                self.data[record.name.value] = record
+                self[record.name.value] = record
             else:
                 raise TypeError("Only Record objects can be added to AddressBook.")
             
         def find(self,name):
             return self.data.get(name)
+
+        def find_by_phone(self, phone):
+            """
+            Returns list of contacts owning given phone number (empty list if nobody has it)
+            """
+            self._load_all()
+            return list(self._phone_index.get(phone, {}).values())
         
         def delete(self, name):
             if name in self.data:
-                del self.data[name]
+                del self[name]
             else:
                 raise KeyError(f"Contact '{name}' not found in the address book.")
         
-        def get_upcoming_birthdays(self):
+        def _congratulation_date(self, birthday, today):
+            # Replace year with the current year
+            birthday_this_year = birthday.replace(year=today.year)
+
+            # If birthday already passed this year, use next year
+            if birthday_this_year < today:
+                birthday_this_year = birthday_this_year.replace(year=today.year + 1)
+
+            # If birthday is on weekend, move to next Monday
+            if birthday_this_year.weekday() == 5:  # Saturday
+                birthday_this_year += timedelta(days=2)
+            elif birthday_this_year.weekday() == 6:  # Sunday
+                birthday_this_year += timedelta(days=1)
+            return birthday_this_year
+
+        def _has_birthdays_on(self, month_day):
+            return month_day in self._birthday_index
+
+        def _birthdays_on(self, month_days):
+            """
+            Yields (name, birthday date, book position) for contacts born on given (month, day) pairs
+            """
+            for month_day in month_days:
+                for name, record in self._birthday_index.get(month_day, {}).items():
+                    yield name, record.birthday.value, self._positions[name]
+
+        def _cache_version(self):
+            self._sync_indexes()
+            return self.version
+
+        def get_upcoming_birthdays(self, days=7):
+            """
+            Contacts to congratulate in next days (list of dicts), or message if there is nobody.
+            Result is cached until the book changes or the day rolls over, callers must not change it
+            """
             today = date.today()
-            upcoming_birthdays = []
+            key = (self._cache_version(), today, days)
+            cached = self._upcoming_cache
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            result = self._compute_upcoming_birthdays(today, days)
+            self._upcoming_cache = (key, result)
+            return result
+
+        def _compute_upcoming_birthdays(self, today, days):
+            self._load_all()
             try:
-                for name, record in self.data.items():
-                    if record.birthday is not None: # if not populated
-                        # Replace year with the current year
-                        birthday_this_year = record.birthday.value.replace(year=today.year)
-
-                        # If birthday already passed this year, use next year
-                        if birthday_this_year < today:
-                            birthday_this_year = birthday_this_year.replace(year=today.year + 1)
-
-                        # If birthday is on weekend, move to next Monday
-                        if birthday_this_year.weekday() == 5:  # Saturday
-                            birthday_this_year += timedelta(days=2)
-                        elif birthday_this_year.weekday() == 6:  # Sunday
-                            birthday_this_year += timedelta(days=1)
-                        
-                        # Check if the (possibly shifted) date is within the next 7 days
-                        if 0 <= (birthday_this_year - today).days <= 7:
-                            upcoming_birthdays.append({
-                                "name": name,
-                                "original_birthday": record.birthday.value.strftime("%d.%m.%Y"),
-                                "congratulation_date": birthday_this_year.strftime("%d.%m.%Y")
-                            })
-                    
-                if len(upcoming_birthdays) == 0:
-                    return 'There is no one to congratulate in next 7 days'
+                # Feb 29 has no date in most years, so it is checked every time like a full scan would do
+                if self._has_birthdays_on((2, 29)):
+                    self._congratulation_date(date(2000, 2, 29), today)
+
+                if self._birthday_columns is not None:
+                    sorted_upcoming_birthdays = self._birthday_columns.upcoming(today, days)
+                else:
+                    sorted_upcoming_birthdays = [birthday for _, birthday in self._upcoming_entries(today, days)]
+
+                if len(sorted_upcoming_birthdays) == 0:
+                    return f'There is no one to congratulate in next {days} days'
                 else:
-                    sorted_upcoming_birthdays = sorted(upcoming_birthdays, key=lambda x: x['congratulation_date'])
                     return sorted_upcoming_birthdays  
-                    # return f"Congratulations list for next seven days:\n {sorted_upcoming_birthdays}"  
             except ValueError:
                 raise ValueError(f"Wrong incoming data, please check your adressbook")
 
+        def _upcoming_entries(self, today, days):
+            """
+            (book position, birthday dict) pairs of get_upcoming_birthdays result, sorted the same way
+            """
+            upcoming_birthdays = []
+            # Weekend shift only moves dates forward, so only birthdays falling into the window can hit it
+            window_days = dict.fromkeys(
+                ((today + timedelta(days=offset)).month, (today + timedelta(days=offset)).day)
+                for offset in range(min(days, 366) + 1)
+            )
+            for name, birthday, position in self._birthdays_on(window_days):
+                birthday_this_year = self._congratulation_date(birthday, today)
+
+                # Check if the (possibly shifted) date is within the next N days
+                if 0 <= (birthday_this_year - today).days <= days:
+                    upcoming_birthdays.append((position, {
+                        "name": name,
+                        "original_birthday": birthday.strftime("%d.%m.%Y"),
+                        "congratulation_date": birthday_this_year.strftime("%d.%m.%Y")
+                    }))
+
+            # Ties keep the book order, same as scanning all records would give
+            upcoming_birthdays.sort(key=upcoming_order)
+            return upcoming_birthdays
+
+        def _name_index(self):
+            self._load_all()
+            return self._names
+
+        def search(self, fragment, max_distance=0):
+            """
+            Contacts whose name starts with fragment (case-insensitive),
+            or with max_distance > 0 contacts whose name is within max_distance typos from fragment
+            """
+            names = self._name_index()
+            found = names.fuzzy(fragment, max_distance) if max_distance else names.prefix(fragment)
+            return [self.data[name] for name in found]
+
+        def page(self, size, number=1, after=None):
+            """
+            Page of (name, Record) pairs sorted by name: page number (from 1), or the page right after given name
+            """
+            names = self._name_index()
+            if after is not None:
+                page_names = names.after(after, size)
+            else:
+                page_names = names.page((number - 1) * size, size)
+            return [(name, self.data[name]) for name in page_names]
+
+        def bulk_import(self, path):
+            """
+            Streams contacts from CSV or JSONL file into the book, merging them like 'add' command does.
+            Returns dict with added/updated/rejected counters and first rejected rows as (line number, reason)
+            """
+            return merge_contact_rows(self, validate_contact_rows(read_contact_rows(path)))
+
+        def dedupe(self, dry_run=True):
+            """
+            Merges contacts sharing a phone number or a normalized name into the first of them in book order.
+            With dry_run only reports what would be merged. Returns dict with groups and duplicates counters
+            and first groups as (kept name, [merged names])
+            """
+            self._load_all()
+            groups = find_duplicate_groups(self.data.values())
+            report = {"groups": len(groups), "duplicates": 0, "merged": []}
+            for group in groups:
+                report["duplicates"] += len(group) - 1
+                if len(report["merged"]) < DEDUPE_GROUPS_KEPT:
+                    report["merged"].append((group[0].name.value, [record.name.value for record in group[1:]]))
+                if not dry_run:
+                    merge_records(self, group)
+            return report
+
+        def _resident_records(self):
+            # records kept in memory right now, lazily opened books don't have the untouched ones yet
+            if isinstance(self.data, LazyRecords):
+                return self.data._loaded.values()
+            return self.data.values()
+
+        def memory_usage(self):
+            """
+            Memory taken by the book: deep size of records by field type and of indexes, total and per contact.
+            traced_bytes / traced_peak_bytes come from tracemalloc (whole process), only when it is running
+            """
+            traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+            self._sync_indexes()
+            seen = {id(self)} # records point back to the book
+            getsizeof = sys.getsizeof
+
+            def field_size(field):
+                # fields belong to one record, but their values may be shared (index keys, cached dates)
+                value = field.value
+                size = getsizeof(field)
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    size += getsizeof(value)
+                return size
+
+            by_type = dict.fromkeys(("Record", "Name", "Phone", "Birthday"), 0)
+            resident = 0
+            for record in self._resident_records():
+                resident += 1
+                seen.update((id(record), id(record.phones)))
+                by_type["Record"] += getsizeof(record) + getsizeof(record.phones)
+                by_type["Name"] += field_size(record.name)
+                for phone in record.phones:
+                    by_type["Phone"] += field_size(phone)
+                if record.birthday is not None:
+                    by_type["Birthday"] += field_size(record.birthday)
+            # names used as keys are mostly the same str objects as Name values, seen keeps them from counting twice
+            by_type["indexes"] = sum(
+                deep_sizeof(part, seen)
+                for part in (self.data, self._phone_index, self._birthday_index, self._positions, self._names, self._birthday_columns)
+            )
+            total = sum(by_type.values())
+            return {
+                "contacts": len(self),
+                "resident_contacts": resident,
+                "total_bytes": total,
+                "bytes_per_contact": round(total / resident, 1) if resident else 0,
+                "by_type": by_type,
+                "traced_bytes": traced[0],
+                "traced_peak_bytes": traced[1],
+            }
+
+        def export(self, path, format_name=None):
+            """
+            Streams all contacts to CSV, JSONL or vCard file (format from the extension if not given),
+            gzip-compressed when path ends with .gz. Returns number of exported contacts
+            """
+            if isinstance(self.data, LazyRecords):
+                records = self.data.peek_values()
+            else:
+                records = self.data.values()
+            return write_contacts(records, path, format_name)
+
+        def close(self):
+            if self.journal is not None:
+                self.journal.close()
+
+def upcoming_order(entry):
+    # sort key of (book position, birthday dict) entries: congratulation date text, then book order
+    position, birthday = entry
+    return birthday["congratulation_date"], position
+
+#--------------------------------------------------- STORAGE ----------------------------------------------------------------------
+def format_birthday(birthday):
+    """
+    Birthday as DD.MM.YYYY string (the format Birthday accepts) or None if not set
+    """
+    if birthday is None:
+        return None
+    return birthday.value.strftime("%d.%m.%Y")
+
+class BookSnapshot:
+    """
+    Read-only binary snapshot of AddressBook opened with mmap.
+
+    Layout: header (magic, seq, count, directory offset), one block per contact
+    (name, phones and birthday as date ordinal, 0 if not set), then directory
+    of (offset, size) entries, both in book order, then directory indexes sorted by name.
+    Index in the directory is the book position of the contact.
+    """
+    HEADER = struct.Struct("<4sQQQ")
+    ENTRY = struct.Struct("<QI")
+    NAME_ENTRY = struct.Struct("<I")
+    MAGIC = b"ABK3"
+
+    def __init__(self, path):
+        with open(path, "rb") as snapshot:
+            self._map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.seq, self._count, self._directory = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"'{path}' is not an address book snapshot")
+        self._names = self._directory + self._count * self.ENTRY.size
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, index):
+        return self.ENTRY.unpack_from(self._map, self._directory + index * self.ENTRY.size)
+
+    def _name_bytes(self, offset):
+        size, = struct.unpack_from("<H", self._map, offset)
+        return self._map[offset + 2:offset + 2 + size]
+
+    def name_at(self, index):
+        offset, _ = self._entry(index)
+        return self._name_bytes(offset).decode("utf-8")
+
+    def index_of(self, name):
+        """
+        Position of contact in the directory (binary search by name) or -1
+        """
+        key = name.encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_bytes(self._entry(self._by_name(middle))[0]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            index = self._by_name(low)
+            if self._name_bytes(self._entry(index)[0]) == key:
+                return index
+        return -1
+
+    def _by_name(self, rank):
+        return self.NAME_ENTRY.unpack_from(self._map, self._names + rank * self.NAME_ENTRY.size)[0]
+
+    def block_at(self, index):
+        offset, size = self._entry(index)
+        return self._map[offset:offset + size]
+
+    def record_at(self, index):
+        return decode_record(self.block_at(index))
+
+    @classmethod
+    def write(cls, path, seq, blocks):
+        """
+        Writes snapshot from (name, encoded block) pairs in book order
+        """
+        directory = []
+        names = []
+        with open(path, "wb") as snapshot:
+            snapshot.write(bytes(cls.HEADER.size))
+            for name, block in blocks:
+                directory.append(cls.ENTRY.pack(snapshot.tell(), len(block)))
+                names.append(name)
+                snapshot.write(block)
+            directory_offset = snapshot.tell()
+            snapshot.write(b"".join(directory))
+            # str order of names is the order of their UTF-8 bytes, which index_of() compares
+            by_name = sorted(range(len(names)), key=names.__getitem__)
+            snapshot.write(b"".join(cls.NAME_ENTRY.pack(index) for index in by_name))
+            snapshot.seek(0)
+            snapshot.write(cls.HEADER.pack(cls.MAGIC, seq, len(directory), directory_offset))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+
+def encode_record(record:Record):
+    name = record.name.value.encode("utf-8")
+    parts = [struct.pack("<H", len(name)), name, struct.pack("<I", len(record.phones))]
+    for phone in record.phones:
+        phone_bytes = phone.value.encode("utf-8")
+        parts.append(struct.pack("<B", len(phone_bytes)))
+        parts.append(phone_bytes)
+    parts.append(struct.pack("<i", record.birthday.value.toordinal() if record.birthday is not None else 0))
+    return b"".join(parts)
+
+def decode_record(block):
+    size, = struct.unpack_from("<H", block, 0)
+    position = 2 + size
+    record = Record(block[2:position].decode("utf-8"))
+    phones_count, = struct.unpack_from("<I", block, position)
+    position += 4
+    for _ in range(phones_count):
+        size = block[position]
+        record.phones.append(Phone.from_value(block[position + 1:position + 1 + size].decode("utf-8")))
+        position += 1 + size
+    ordinal, = struct.unpack_from("<i", block, position)
+    if ordinal:
+        record.birthday = Birthday.from_value(date.fromordinal(ordinal))
+    return record
+
+class LazyRecords(MutableMapping):
+    """
+    AddressBook.data over BookSnapshot: contacts stay encoded in the mapped file
+    until first access, changes are kept in memory on top of it.
+    """
+    def __init__(self, snapshot:BookSnapshot, book:AddressBook):
+        self.snapshot = snapshot
+        self._book = book
+        self._loaded = {} # decoded snapshot contacts and contacts added after opening
+        self._hidden = set() # snapshot contacts deleted after opening
+        self._extra = {} # names added after opening (ordered set), they go after snapshot ones
+
+    def _snapshot_index(self, name):
+        if name in self._hidden or name in self._extra:
+            return -1
+        return self.snapshot.index_of(name)
+
+    def __getitem__(self, name):
+        record = self._loaded.get(name)
+        if record is not None:
+            return record
+        index = self._snapshot_index(name)
+        if index < 0:
+            raise KeyError(name)
+        return self._decode(name, index)
+
+    def _decode(self, name, index):
+        record = self.snapshot.record_at(index)
+        self._loaded[name] = record
+        self._book._attach(record, index)
+        return record
+
+    def __contains__(self, name):
+        return name in self._loaded or self._snapshot_index(name) >= 0
+
+    def __setitem__(self, name, record):
+        if name not in self._loaded and self._snapshot_index(name) < 0:
+            self._extra[name] = None
+        self._loaded[name] = record
+
+    def __delitem__(self, name):
+        if name in self._extra:
+            del self._extra[name]
+            del self._loaded[name]
+        elif self._snapshot_index(name) >= 0:
+            self._hidden.add(name)
+            self._loaded.pop(name, None)
+        else:
+            raise KeyError(name)
+
+    def __iter__(self):
+        for index in range(len(self.snapshot)):
+            name = self.snapshot.name_at(index)
+            if name not in self._hidden:
+                yield name
+        yield from list(self._extra)
+
+    def __len__(self):
+        return len(self.snapshot) - len(self._hidden) + len(self._extra)
+
+    def reorder(self, positions):
+        """
+        Puts contacts back in book order after rollback: snapshot ones to their place, added ones by position
+        """
+        for name in list(self._extra):
+            position = positions[name]
+            if position < len(self.snapshot) and self.snapshot.name_at(position) == name:
+                del self._extra[name]
+                self._hidden.discard(name)
+        self._extra = dict.fromkeys(sorted(self._extra, key=positions.__getitem__))
+
+    def load_all(self):
+        if len(self._loaded) < len(self):
+            for index in range(len(self.snapshot)):
+                name = self.snapshot.name_at(index)
+                if name not in self._loaded and name not in self._hidden:
+                    self._decode(name, index)
+
+    def peek_values(self):
+        """
+        Records in book order, untouched contacts are decoded without keeping them, for one pass over big book
+        """
+        for index in range(len(self.snapshot)):
+            name = self.snapshot.name_at(index)
+            if name in self._hidden:
+                continue
+            record = self._loaded.get(name)
+            yield record if record is not None else self.snapshot.record_at(index)
+        for name in list(self._extra):
+            yield self._loaded[name]
+
+    def encoded_blocks(self):
+        """
+        (name, encoded block) pairs in book order, untouched contacts are copied from snapshot as is
+        """
+        for index in range(len(self.snapshot)):
+            name = self.snapshot.name_at(index)
+            if name in self._hidden:
+                continue
+            record = self._loaded.get(name)
+            yield name, encode_record(record) if record is not None else self.snapshot.block_at(index)
+        for name in list(self._extra):
+            yield name, encode_record(self._loaded[name])
+
+def apply_change(book:AddressBook, action, name, *args):
+    """
+    Applies one journaled change to the book
+    """
+    if action == "add_record":
+        phones, birthday_string = args
+        record = Record(name)
+        for phone in phones:
+            record.add_phone(phone)
+        if birthday_string is not None:
+            record.add_birthday(birthday_string)
+        book.add_record(record)
+    elif action == "delete":
+        book.delete(name)
+    else:
+        record:Record = book.find(name)
+        getattr(record, action)(*args)
+
+class Journal:
+    """
+    Append-only log of AddressBook changes, one JSON line per change.
+    Several changes written close to each other share one fsync (group commit),
+    and every compact_every changes the whole book goes to a snapshot and the log starts over.
+    """
+    def __init__(self, snapshot_path, journal_path, group_size=100, group_interval=0.05, compact_every=10_000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.compact_every = compact_every
+        self.book = None
+        self.seq = 0 # number of the last written change, snapshot remembers the one it includes
+        self.changes_since_snapshot = 0
+        self._pending = 0
+        self._first_pending = 0.0 # when the oldest change not synced yet was written
+        self._last_sync = 0.0
+        self._file = None
+        self._lock = threading.RLock() # the flusher thread syncs while the book keeps writing
+        self._closing = threading.Event()
+        self._flusher = None
+
+    def load(self):
+        """
+        Builds the book from the last snapshot plus the journal written after it
+        """
+        if os.path.exists(self.snapshot_path):
+            book = AddressBook.from_snapshot(self.snapshot_path)
+            snapshot_seq = book.data.snapshot.seq
+        else:
+            book = AddressBook()
+            snapshot_seq = 0
+        self.seq = snapshot_seq
+
+        valid_size = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as journal:
+                for line in journal:
+                    try:
+                        seq, action, name, *args = json.loads(line)
+                    except ValueError:
+                        break # line torn by a crash, everything after it was never committed
+                    valid_size += len(line)
+                    if seq > snapshot_seq:
+                        apply_change(book, action, name, *args)
+                        self.seq = seq
+                        self.changes_since_snapshot += 1
+            # drop the torn tail so new lines are not glued to it
+            os.truncate(self.journal_path, valid_size)
+
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+        self.book = book
+        book.journal = self
+        self._flusher = threading.Thread(target=self._flush_tail, name="journal-flush", daemon=True)
+        self._flusher.start()
+        return book
+
+    def _flush_tail(self):
+        # the last changes of a burst get no later write to sync them, so they are synced once group_interval passes
+        while not self._closing.wait(self.group_interval / 2):
+            with self._lock:
+                if self._pending and time.monotonic() - self._first_pending >= self.group_interval:
+                    self.sync()
+
+    def write(self, action, name, *args):
+        with self._lock:
+            self.seq += 1
+            self._file.write(json.dumps([self.seq, action, name, *args]) + "\n")
+            if not self._pending:
+                self._first_pending = time.monotonic()
+            self._pending += 1
+            self.changes_since_snapshot += 1
+            if self._pending >= self.group_size or time.monotonic() - self._last_sync >= self.group_interval:
+                self.sync()
+            self._compact_if_due()
+
+    def write_many(self, changes):
+        """
+        Writes (action, name, args) changes of one transaction with one fsync
+        """
+        with self._lock:
+            lines = []
+            for action, name, args in changes:
+                self.seq += 1
+                lines.append(json.dumps([self.seq, action, name, *args]) + "\n")
+            self._file.write("".join(lines))
+            self._pending += len(lines)
+            self.changes_since_snapshot += len(lines)
+            self.sync()
+            self._compact_if_due()
+
+    def _compact_if_due(self):
+        if self.changes_since_snapshot < self.compact_every:
+            return
+        try:
+            self.compact()
+        except (OSError, ValueError, struct.error) as error:
+            # changes are already durable in the journal, the snapshot is tried again compact_every changes later
+            self.changes_since_snapshot = 0
+            print(f"Journal compaction failed, journal keeps growing: {error}", file=sys.stderr)
+
+    def sync(self):
+        """
+        Makes all written changes durable with one fsync
+        """
+        with self._lock:
+            if self._pending:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._pending = 0
+            self._last_sync = time.monotonic()
+
+    def compact(self):
+        """
+        Writes the whole book to the snapshot and empties the journal
+        """
+        with self._lock:
+            self.sync()
+            temp_path = self.snapshot_path + ".tmp"
+            if isinstance(self.book.data, LazyRecords):
+                blocks = self.book.data.encoded_blocks()
+            else:
+                blocks = ((name, encode_record(record)) for name, record in self.book.data.items())
+            try:
+                BookSnapshot.write(temp_path, self.seq, blocks)
+            except BaseException:
+                # old snapshot and journal are untouched, only the half written file goes
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            os.replace(temp_path, self.snapshot_path)
+            # a crash before truncation is harmless, load() skips changes already in the snapshot
+            self._file.close()
+            self._file = open(self.journal_path, "w", encoding="utf-8")
+            self.changes_since_snapshot = 0
+
+    def close(self):
+        self._closing.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._file is not None:
+                self.sync()
+                self._file.close()
+                self._file = None
+        if self.book is not None:
+            self.book.journal = None
+
+class SqliteRecords(MutableMapping):
+    """
+    AddressBook.data kept in SQLite contacts/phones tables instead of memory
+    """
+    def __init__(self, connection, book):
+        self._connection = connection
+        self._book = book
+
+    def __getitem__(self, name):
+        row = self._connection.execute("SELECT id, birthday FROM contacts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        contact_id, birthday = row
+        record = Record(name)
+        for phone, in self._connection.execute("SELECT phone FROM phones WHERE contact_id = ? ORDER BY id", (contact_id,)):
+            record.phones.append(Phone.from_value(phone))
+        if birthday is not None:
+            record.birthday = Birthday.from_value(date.fromordinal(birthday))
+        record.book = self._book
+        return record
+
+    def __contains__(self, name):
+        return self._connection.execute("SELECT 1 FROM contacts WHERE name = ?", (name,)).fetchone() is not None
+
+    def __setitem__(self, name, record):
+        birthday = record.birthday.value if record.birthday is not None else None
+        with self._book._transaction():
+            self._connection.execute(
+                "INSERT INTO contacts (name, birthday, birthday_md) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET birthday = excluded.birthday, birthday_md = excluded.birthday_md",
+                (name, birthday.toordinal() if birthday else None, birthday.month * 100 + birthday.day if birthday else None)
+            )
+            contact_id, = self._connection.execute("SELECT id FROM contacts WHERE name = ?", (name,)).fetchone()
+            self._connection.execute("DELETE FROM phones WHERE contact_id = ?", (contact_id,))
+            self._connection.executemany(
+                "INSERT INTO phones (contact_id, phone) VALUES (?, ?)",
+                ((contact_id, phone.value) for phone in record.phones)
+            )
+
+    def __delitem__(self, name):
+        with self._book._transaction():
+            row = self._connection.execute("SELECT id FROM contacts WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            self._connection.execute("DELETE FROM phones WHERE contact_id = ?", row)
+            self._connection.execute("DELETE FROM contacts WHERE id = ?", row)
+
+    def __iter__(self):
+        for name, in self._connection.execute("SELECT name FROM contacts ORDER BY id"):
+            yield name
+
+    def __len__(self):
+        count, = self._connection.execute("SELECT COUNT(*) FROM contacts").fetchone()
+        return count
+
+class SqliteAddressBook(AddressBook):
+    """
+    AddressBook stored in SQLite file: same API, but the book does not have to fit in memory
+    and one file can be shared by several processes.
+    Records returned by find() write their changes straight to the database.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            birthday INTEGER,   -- date ordinal
+            birthday_md INTEGER -- month * 100 + day, for birthday window queries
+        );
+        CREATE TABLE IF NOT EXISTS phones (
+            id INTEGER PRIMARY KEY,
+            contact_id INTEGER NOT NULL,
+            phone TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS contacts_birthday_md ON contacts (birthday_md);
+        CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+        CREATE INDEX IF NOT EXISTS phones_contact ON phones (contact_id);
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(self.SCHEMA)
+        self.data = SqliteRecords(self._connection, self)
+        self._names = None # names for search, read from the database on first search
+
+    @contextmanager
+    def _transaction(self):
+        # every change commits on its own, except inside batch() which commits them together
+        if self._batch is not None:
+            yield
+        else:
+            with self._connection:
+                yield
+
+    @contextmanager
+    def batch(self):
+        """
+        Transaction over SQLite transaction: changes inside are committed together or rolled back on error
+        """
+        if self._batch is not None:
+            yield self
+            return
+        batch = self._batch = BookBatch()
+        self._connection.execute("BEGIN")
+        try:
+            yield self
+        except BaseException:
+            self._batch = None
+            self._connection.rollback()
+            self._names = None # may know names of rolled back contacts
+            self.version += 1
+            raise
+        self._batch = None
+        self._connection.commit()
+        self._flush_changes(batch.changes)
+
+    def _record_will_change(self, record):
+        pass # the database rolls back by itself
+
+    def __setitem__(self, name, record):
+        if self._names is not None and name not in self.data:
+            self._names.add(name)
+        self.data[name] = record
+        record.book = self
+        self.version += 1
+        if self.feed is not None:
+            self._log_change("add_record", name, [phone.value for phone in record.phones], format_birthday(record.birthday))
+
+    def __delitem__(self, name):
+        del self.data[name]
+        if self._names is not None:
+            self._names.remove(name)
+        self.version += 1
+        self._log_change("delete", name)
+
+    def _cache_version(self):
+        # data_version changes when another connection (process) commits to the file
+        return self.version, self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def _name_index(self):
+        # only names are kept in memory, changes made by other processes show up after reopening
+        if self._names is None:
+            names = NameIndex()
+            for name, in self._connection.execute("SELECT name FROM contacts"):
+                names.add(name)
+            self._names = names
+        return self._names
+
+    def _record_changed(self, record, action, *args):
+        self.version += 1
+        contact_id = "(SELECT id FROM contacts WHERE name = ?)"
+        name = record.name.value
+        with self._transaction():
+            if action == "add_phone":
+                phone, = args
+                self._connection.execute(f"INSERT INTO phones (contact_id, phone) VALUES ({contact_id}, ?)", (name, phone))
+            elif action == "edit_phone":
+                old_phone, new_phone = args
+                self._connection.execute(
+                    f"UPDATE phones SET phone = ? WHERE id = (SELECT MIN(id) FROM phones WHERE contact_id = {contact_id} AND phone = ?)",
+                    (new_phone, name, old_phone)
+                )
+            elif action == "remove_phone":
+                phone, = args
+                self._connection.execute(
+                    f"DELETE FROM phones WHERE id = (SELECT MIN(id) FROM phones WHERE contact_id = {contact_id} AND phone = ?)",
+                    (name, phone)
+                )
+            elif action == "add_birthday":
+                birthday = record.birthday.value
+                self._connection.execute(
+                    "UPDATE contacts SET birthday = ?, birthday_md = ? WHERE name = ?",
+                    (birthday.toordinal(), birthday.month * 100 + birthday.day, name)
+                )
+        if action == "add_birthday":
+            self._log_change(action, name, format_birthday(record.birthday))
+        else:
+            self._log_change(action, name, *args)
+
+    def enable_vectorized_birthdays(self):
+        # the database already hands out only birthdays inside the window
+        return False
+
+    def _resident_records(self):
+        return () # records live in the database, find() makes them on every call
+
+    def find_by_phone(self, phone):
+        names = self._connection.execute(
+            "SELECT DISTINCT contacts.name FROM phones JOIN contacts ON contacts.id = phones.contact_id "
+            "WHERE phones.phone = ? ORDER BY contacts.id",
+            (phone,)
+        ).fetchall()
+        return [self.data[name] for name, in names]
+
+    def _has_birthdays_on(self, month_day):
+        month, day = month_day
+        row = self._connection.execute("SELECT 1 FROM contacts WHERE birthday_md = ? LIMIT 1", (month * 100 + day,)).fetchone()
+        return row is not None
+
+    def _birthdays_on(self, month_days):
+        keys = [month * 100 + day for month, day in month_days]
+        rows = self._connection.execute(
+            f"SELECT name, birthday, id FROM contacts WHERE birthday_md IN ({', '.join('?' * len(keys))})",
+            keys
+        )
+        for name, birthday, contact_id in rows:
+            yield name, date.fromordinal(birthday), contact_id
+
+    def close(self):
+        self._connection.close()
+
+def open_book(snapshot_path, journal_path, **journal_options):
+    """
+    Opens persistent AddressBook, every change made to it is journaled until journal.close()
+    """
+    return Journal(snapshot_path, journal_path, **journal_options).load()
+
+#--------------------------------------------------- CHANGE FEED ------------------------------------------------------------------
+# journal action -> event kind
+FEED_EVENT_KINDS = {
+    "add_record": "record_added",
+    "delete": "record_deleted",
+    "add_phone": "phone_added",
+    "edit_phone": "phone_edited",
+    "remove_phone": "phone_removed",
+    "add_birthday": "birthday_set",
+}
+FEED_ACTIONS = {kind: action for action, kind in FEED_EVENT_KINDS.items()}
+
+# args are the same as in the journal: record_added (phones, birthday or None), phone_added (phone,),
+# phone_edited (old phone, new phone), phone_removed (phone,), birthday_set (birthday,), record_deleted ()
+ChangeEvent = namedtuple("ChangeEvent", "seq kind name args")
+
+class ChangeFeedGap(LookupError):
+    """
+    Events after asked sequence number are not in the feed anymore, the consumer has to re-read the whole book
+    """
+
+class ChangeFeed:
+    """
+    Ordered stream of book changes with sequence numbers, last capacity events are kept in a ring buffer
+    so consumers can resume from the last sequence number they have seen
+    """
+    def __init__(self, capacity=10_000):
+        self._events = deque(maxlen=capacity)
+        self.last_seq = 0
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, action, name, *args):
+        with self._lock:
+            self.last_seq += 1
+            event = ChangeEvent(self.last_seq, FEED_EVENT_KINDS[action], name, args)
+            self._events.append(event)
+            subscribers = self._subscribers
+        for callback in subscribers:
+            callback(event)
+        return event
+
+    def since(self, seq):
+        """
+        Events with sequence number greater than seq, raises ChangeFeedGap if some of them were already dropped
+        """
+        with self._lock:
+            return list(self._events_after(seq))
+
+    def _events_after(self, seq):
+        oldest = self._events[0].seq if self._events else self.last_seq + 1
+        if seq < oldest - 1 or seq > self.last_seq:
+            # seq ahead of the feed means the feed was started over (the bot was restarted)
+            raise ChangeFeedGap(f"Changes after {seq} are not available, feed keeps {oldest}..{self.last_seq}")
+        return itertools.islice(self._events, seq - oldest + 1, None)
+
+    def subscribe(self, callback, since=None):
+        """
+        Calls callback(event) for every new event. With since, events after that sequence number are replayed first
+        """
+        with self._lock:
+            if since is not None:
+                for event in self._events_after(since):
+                    callback(event)
+            # new list instead of append, publish() may be iterating the old one right now
+            self._subscribers = [*self._subscribers, callback]
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber is not callback]
+
+def apply_event(book:AddressBook, event:ChangeEvent):
+    """
+    Applies change feed event to another book, keeping it in sync with the source
+    """
+    apply_change(book, FEED_ACTIONS[event.kind], event.name, *event.args)
+
+#--------------------------------------------------- SHARDS -----------------------------------------------------------------------
+class ShardBook(AddressBook):
+    """
+    Part of ShardedAddressBook living in a worker process, positions come from the whole book
+    """
+    def add_at(self, record, position):
+        # replacing a contact keeps its place in the book, like AddressBook.add_record does
+        known = record.name.value in self.data
+        self.add_record(record)
+        if not known:
+            self._positions[record.name.value] = position
+
+    def add_many(self, rows):
+        """
+        Adds (name, phones, birthday date or None, position) rows sent by ShardedAddressBook.add_records
+        """
+        for name, phones, birthday, position in rows:
+            record = Record(name)
+            record.phones = [Phone.from_value(phone) for phone in phones]
+            if birthday is not None:
+                record.birthday = Birthday.from_value(birthday)
+            self.add_at(record, position)
+
+    def upcoming_entries(self, today, days):
+        """
+        Sorted (congratulation date, position, name, original birthday) tuples, cheaper to send than dicts
+        """
+        if self._has_birthdays_on((2, 29)):
+            self._congratulation_date(date(2000, 2, 29), today)
+        return [
+            (birthday["congratulation_date"], position, birthday["name"], birthday["original_birthday"])
+            for position, birthday in self._upcoming_entries(today, days)
+        ]
+
+    def apply(self, action, name, *args):
+        apply_change(self, action, name, *args)
+
+    def run(self, function, *args):
+        return function(self, *args)
+
+def run_shard(connection):
+    """
+    Worker process loop: runs (method name, args) requests against its ShardBook, None stops it
+    """
+    book = ShardBook()
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            result = getattr(book, method)(*args)
+        except Exception as error:
+            connection.send((False, error))
+        else:
+            connection.send((True, result))
+    connection.close()
+
+class ShardedAddressBook:
+    """
+    Address book split by name hash between worker processes, so whole-book scans use several cores.
+    Point operations go to the shard owning the name, scans run on all shards at once and results are merged.
+    Records returned by find() are copies: their changes are sent to the owning shard.
+    Not thread safe, use it from one thread
+    """
+    lock = None # bot commands run without locking
+    journal = None
+
+    def __init__(self, shards=None):
+        self._connections = []
+        self._processes = []
+        self._next_position = itertools.count()
+        for _ in range(shards or os.cpu_count() or 1):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_shard, args=(worker_connection,), daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def _shard(self, name):
+        return self._connections[self._shard_index(name)]
+
+    def _shard_index(self, name):
+        return hash(name) % len(self._connections)
+
+    @staticmethod
+    def _result(connection):
+        ok, result = connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def _call(self, name, method, *args):
+        connection = self._shard(name)
+        connection.send((method, args))
+        return self._result(connection)
+
+    def _call_all(self, method, *args):
+        # every shard gets the request before waiting for the first answer, so they work in parallel
+        for connection in self._connections:
+            connection.send((method, args))
+        return [self._result(connection) for connection in self._connections]
+
+    def add_record(self, record):
+        if not isinstance(record, Record):
+            raise TypeError("Only Record objects can be added to AddressBook.")
+        self._call(record.name.value, "add_at", record, next(self._next_position))
+        record.book = self
+
+    def add_records(self, records, chunk_size=5000):
+        """
+        Adds many records with one request per shard for every chunk_size records,
+        instead of a round trip per record. Shards add their parts of a chunk in parallel
+        """
+        parts = [[] for _ in self._connections]
+        for count, record in enumerate(records, start=1):
+            if not isinstance(record, Record):
+                raise TypeError("Only Record objects can be added to AddressBook.")
+            # plain values pickle several times faster than Record objects, the shard builds records back
+            name = record.name.value
+            birthday = record.birthday.value if record.birthday is not None else None
+            parts[self._shard_index(name)].append(
+                (name, [phone.value for phone in record.phones], birthday, next(self._next_position))
+            )
+            record.book = self
+            if count % chunk_size == 0:
+                self._add_parts(parts)
+                parts = [[] for _ in self._connections]
+        self._add_parts(parts)
+
+    def _add_parts(self, parts):
+        # like _call_all, every shard gets its part before waiting for the first answer
+        busy = [connection for connection, part in zip(self._connections, parts) if part]
+        for connection, part in zip(self._connections, parts):
+            if part:
+                connection.send(("add_many", (part,)))
+        for connection in busy:
+            self._result(connection)
+
+    def find(self, name):
+        record = self._call(name, "find", name)
+        if record is not None:
+            record.book = self
+        return record
+
+    def delete(self, name):
+        self._call(name, "delete", name)
+
+    def _record_will_change(self, record):
+        pass
+
+    def _record_changed(self, record, action, *args):
+        if action == "add_birthday":
+            args = (format_birthday(record.birthday),)
+        self._call(record.name.value, "apply", action, record.name.value, *args)
+
+    def find_by_phone(self, phone):
+        records = [record for shard_records in self._call_all("find_by_phone", phone) for record in shard_records]
+        for record in records:
+            record.book = self
+        return records
+
+    def __len__(self):
+        return sum(self._call_all("__len__"))
+
+    def map_shards(self, function, *args):
+        """
+        Runs function(shard_book, *args) in every worker process, returns list of results.
+        function has to be picklable (defined at module level)
+        """
+        return self._call_all("run", function, *args)
+
+    def get_upcoming_birthdays(self, days=7):
+        today = date.today()
+        try:
+            shard_entries = self._call_all("upcoming_entries", today, days)
+        except ValueError:
+            raise ValueError("Wrong incoming data, please check your adressbook")
+        # every shard returns its part already sorted, merging keeps the order of one book
+        sorted_upcoming_birthdays = [
+            {"name": name, "original_birthday": original, "congratulation_date": congratulation}
+            for congratulation, _, name, original in heapq.merge(*shard_entries)
+        ]
+        if len(sorted_upcoming_birthdays) == 0:
+            return f'There is no one to congratulate in next {days} days'
+        return sorted_upcoming_birthdays
+
+    def close(self):
+        for connection, process in zip(self._connections, self._processes):
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+            process.join()
+        self._connections = []
+        self._processes = []
+
+#--------------------------------------------------- IMPORT -----------------------------------------------------------------------
+IMPORT_REJECTS_KEPT = 100 # only first rejected rows are kept in report, the rest are just counted
+
+def read_contact_rows(path):
+    """
+    Yields (line number, row) from contacts file, row is dict with name, phones and birthday.
+    CSV needs header with name, phones (or phone) and birthday columns, phones separated by ';'.
+    JSONL needs one object per line with the same keys, phones may be a list.
+    Files ending with .gz are decompressed on the fly.
+    """
+    compressed = path.lower().endswith(".gz")
+    extension = os.path.splitext(path[:-3] if compressed else path)[1].lower()
+    open_file = gzip.open if compressed else open
+    with open_file(path, "rt", encoding="utf-8", newline="") as contacts_file:
+        if extension == ".csv":
+            reader = csv.DictReader(contacts_file)
+            for row in reader:
+                phones = row.get("phones") or row.get("phone") or ""
+                yield reader.line_num, {
+                    "name": row.get("name"),
+                    "phones": [phone for phone in phones.replace(" ", ";").split(";") if phone],
+                    "birthday": row.get("birthday") or None,
+                }
+        elif extension in (".jsonl", ".ndjson"):
+            for line_number, line in enumerate(contacts_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield line_number, None
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None
+                    continue
+                phones = row.get("phones", row.get("phone")) or []
+                yield line_number, {
+                    "name": row.get("name"),
+                    "phones": [phones] if isinstance(phones, str) else phones,
+                    "birthday": row.get("birthday") or None,
+                }
+        else:
+            raise ValueError(f"Unsupported contacts file '{path}', use .csv or .jsonl")
+
+def validate_contact_rows(rows):
+    """
+    Checks every row with the same rules Phone and Birthday use.
+    Yields (line number, row, None) for good rows and (line number, None, reason) for rejected ones
+    """
+    for line_number, row in rows:
+        if row is None:
+            yield line_number, None, "not a JSON object"
+            continue
+        name = row["name"]
+        if not isinstance(name, str) or not name.strip():
+            yield line_number, None, "name is missing"
+            continue
+        if len(name.split()) > 1:
+            # bot commands split arguments on whitespace, such contact could not be used
+            yield line_number, None, "name must be one word"
+            continue
+        # JSONL rows may hold any JSON value there, Phone and Birthday only take strings
+        phones = row["phones"]
+        if not isinstance(phones, list) or not all(isinstance(phone, str) for phone in phones):
+            yield line_number, None, "phones must be a string or a list of strings"
+            continue
+        if row["birthday"] is not None and not isinstance(row["birthday"], str):
+            yield line_number, None, "birthday must be a string"
+            continue
+        try:
+            for phone in row["phones"]:
+                Phone(phone)
+            if row["birthday"] is not None:
+                Birthday(row["birthday"])
+        except ValueError as error:
+            yield line_number, None, str(error)
+            continue
+        yield line_number, row, None
+
+def merge_contact_rows(book:AddressBook, rows):
+    """
+    Adds validated rows to the book: new names become contacts, known ones get new phones and birthday
+    """
+    report = {"added": 0, "updated": 0, "rejected": 0, "rejected_rows": []}
+    for line_number, row, reason in rows:
+        if row is None:
+            report["rejected"] += 1
+            if len(report["rejected_rows"]) < IMPORT_REJECTS_KEPT:
+                report["rejected_rows"].append((line_number, reason))
+            continue
+        name = row["name"].strip().title()
+        record = book.find(name)
+        if record is None:
+            record = Record(name)
+            book.add_record(record)
+            report["added"] += 1
+        else:
+            report["updated"] += 1
+        for phone in row["phones"]:
+            record.add_phone(phone)
+        if row["birthday"] is not None:
+            record.add_birthday(row["birthday"])
+    return report
+
+#--------------------------------------------------- DEDUPE -----------------------------------------------------------------------
+DEDUPE_GROUPS_KEPT = 100 # only first groups are listed in dedupe report, the rest are just counted
+
+def normalize_name(name):
+    """
+    Name key for duplicates: case, punctuation, spacing and word order are ignored
+    """
+    return " ".join(sorted(re.findall(r"[^\W_]+", name.casefold())))
+
+def find_duplicate_groups(records):
+    """
+    Groups of records (in given order, two or more in a group) linked by shared phone numbers or normalized names.
+    Every record is looked up in hash buckets once and groups are joined with union-find, so it's near-linear
+    """
+    records = list(records)
+    parent = list(range(len(records)))
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    first_owner = {} # ("name" | "phone", key) -> index of the first record having it
+    for index, record in enumerate(records):
+        keys = [("name", normalize_name(record.name.value))]
+        keys += [("phone", phone.value) for phone in record.phones]
+        for key in keys:
+            owner = first_owner.setdefault(key, index)
+            if owner != index:
+                first, second = root(owner), root(index)
+                if first != second:
+                    # the earlier record stays the root, so it's the one kept after merging
+                    parent[max(first, second)] = min(first, second)
+
+    groups = {}
+    for index, record in enumerate(records):
+        groups.setdefault(root(index), []).append(record)
+    return [group for group in groups.values() if len(group) > 1]
+
+def merge_records(book:AddressBook, group):
+    """
+    Moves phones (and birthday if the first record has none) of the rest of the group to its first record
+    and deletes the rest from the book
+    """
+    kept, *duplicates = group
+    phones = {phone.value for phone in kept.phones}
+    for duplicate in duplicates:
+        for phone in duplicate.phones:
+            if phone.value not in phones:
+                kept.add_phone(phone.value)
+                phones.add(phone.value)
+        if kept.birthday is None and duplicate.birthday is not None:
+            kept.add_birthday(format_birthday(duplicate.birthday))
+        book.delete(duplicate.name.value)
+
+#--------------------------------------------------- EXPORT -----------------------------------------------------------------------
+EXPORT_FORMATS = {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl", "vcf": "vcard", "vcard": "vcard"}
+EXPORT_CHUNK_CONTACTS = 1000 # contacts rendered to text at once before writing
+EXPORT_BUFFER_SIZE = 1 << 16
+
+def csv_chunks(records):
+    """
+    CSV text in chunks, same columns read_contact_rows expects
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["name", "phones", "birthday"])
+    for chunk in itertools.batched(records, EXPORT_CHUNK_CONTACTS):
+        writer.writerows(
+            [record.name.value, ";".join(phone.value for phone in record.phones), format_birthday(record.birthday) or ""]
+            for record in chunk
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def jsonl_chunks(records):
+    for chunk in itertools.batched(records, EXPORT_CHUNK_CONTACTS):
+        yield "".join(
+            json.dumps({
+                "name": record.name.value,
+                "phones": [phone.value for phone in record.phones],
+                "birthday": format_birthday(record.birthday),
+            }, ensure_ascii=False) + "\n"
+            for record in chunk
+        )
+
+def vcard_text(value):
+    # vCard escaping of backslash, comma, semicolon and new lines
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+def vcard_chunks(records):
+    """
+    vCard 3.0 cards, birthday as ISO date (YYYY-MM-DD) like the standard asks
+    """
+    for chunk in itertools.batched(records, EXPORT_CHUNK_CONTACTS):
+        lines = []
+        for record in chunk:
+            name = vcard_text(record.name.value)
+            lines += ["BEGIN:VCARD", "VERSION:3.0", f"FN:{name}", f"N:{name};;;;"]
+            lines += [f"TEL;TYPE=CELL:{phone.value}" for phone in record.phones]
+            if record.birthday is not None:
+                lines.append(f"BDAY:{record.birthday.value.isoformat()}")
+            lines.append("END:VCARD")
+        yield "\r\n".join(lines) + "\r\n"
+
+EXPORT_WRITERS = {"csv": csv_chunks, "jsonl": jsonl_chunks, "vcard": vcard_chunks}
+
+def write_contacts(records, path, format_name=None):
+    """
+    Writes records to path chunk by chunk, whole document is never kept in memory.
+    Format is csv, jsonl or vcard (taken from the extension if not given), path ending with .gz is gzip-compressed.
+    File is replaced only when everything is written. Returns number of written contacts
+    """
+    compressed = path.lower().endswith(".gz")
+    if format_name is None:
+        format_name = os.path.splitext(path[:-3] if compressed else path)[1].lstrip(".")
+    format_name = EXPORT_FORMATS.get(format_name.lower())
+    if format_name is None:
+        raise ValueError(f"Unsupported export format for '{path}', use csv, jsonl or vcard")
+
+    counted = 0
+    def counting(records):
+        nonlocal counted
+        for counted, record in enumerate(records, start=1):
+            yield record
+
+    temporary_path = path + ".tmp"
+    if compressed:
+        contacts_file = gzip.open(temporary_path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    else:
+        contacts_file = open(temporary_path, "w", encoding="utf-8", newline="", buffering=EXPORT_BUFFER_SIZE)
+    try:
+        with contacts_file:
+            for chunk in EXPORT_WRITERS[format_name](counting(records)):
+                contacts_file.write(chunk)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return counted
+
 #--------------------------------------------------- BOT --------------------------------------------------------------------------
 #--------------------------------------------------- BOT --------------------------------------------------------------------------
 #--------------------------------------------------- BOT --------------------------------------------------------------------------
+class ErrorMessage(str):
+    """
+    Text shown instead of command result when command failed, lets batch mode count failures
+    """
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class HandlerMetrics:
+    """
+    Calls, errors by exception type and latency histogram (seconds, LATENCY_BUCKETS upper bounds) of one handler
+    """
+    __slots__ = ("calls", "errors", "buckets", "total_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1) # last one is for everything slower than the biggest bucket
+        self.total_seconds = 0.0
+
+    def record(self, seconds, error=None):
+        # no lock here: it would cost more than everything else, and a lost increment
+        # when two threads record at the same moment doesn't matter for monitoring
+        self.calls += 1
+        self.total_seconds += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+METRICS = {} # handler name -> HandlerMetrics, filled by input_error
+
+class TimedChunks:
+    """
+    Lazy output of a handler that records its metrics when the output is read to the end, fails or is dropped.
+    Only time spent producing chunks is counted, not the time the caller spends writing them out
+    """
+    def __init__(self, chunks, metrics, seconds):
+        self._chunks = iter(chunks)
+        self._metrics = metrics
+        self._seconds = seconds # time the handler took to return the output
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._seconds += time.perf_counter() - started
+            self.close()
+            raise
+        except BaseException as error:
+            self._seconds += time.perf_counter() - started
+            self.close(type(error).__name__)
+            raise
+        self._seconds += time.perf_counter() - started
+        return chunk
+
+    def close(self, error=None):
+        if self._metrics is not None:
+            self._metrics.record(self._seconds, error)
+            self._metrics = None
+
+    __del__ = close
+
 def input_error(func):
     """
-    Decorator for caching user's input errors like KeyError, ValueError, IndexError
+    Decorator for caching user's input errors like KeyError, ValueError, IndexError.
+    Also counts calls, errors and latency of the handler for 'stats' command
     """
+    metrics = METRICS.setdefault(func.__name__, HandlerMetrics())
+    clock = time.perf_counter
+
     @functools.wraps(func)
     def inner(*args, **kwargs):
+        started = clock()
         try:
-            return func(*args, **kwargs)
-        except ValueError:
-            return "Wrong parameters are provided, please try again with valid data"
-        except KeyError:
+            result = func(*args, **kwargs)
+        except ValueError as error:
+            metrics.record(clock() - started, type(error).__name__)
+            return ErrorMessage("Wrong parameters are provided, please try again with valid data")
+        except KeyError as error:
             # Case when there is no given name available for 'phone' or 'change'
-            return "Contact not found."
-        except IndexError:
+            metrics.record(clock() - started, type(error).__name__)
+            return ErrorMessage("Contact not found.")
+        except IndexError as error:
             # Case when there is no name for phone' 
-            return "Enter user name."
+            metrics.record(clock() - started, type(error).__name__)
+            return ErrorMessage("Enter user name.")
+        except BaseException as error:
+            metrics.record(clock() - started, type(error).__name__)
+            raise
+        if result is None or isinstance(result, str):
+            metrics.record(clock() - started)
+            return result
+        # generator handlers ('all') do their work while the output is read
+        return TimedChunks(result, metrics, clock() - started)
     return inner
 
 # ----------------------------- Decorator ends ----------------------------------------------------------------------
 
+class Command:
+    """
+    Bot command in the registry: handler plus hooks that run around it
+    """
+    def __init__(self, name, handler, aliases=(), takes_args=True, mutates=False):
+        self.name = name
+        self.handler = handler
+        self.aliases = tuple(aliases)
+        self.takes_args = takes_args
+        self.mutates = mutates # changes the book, so it needs exclusive lock on thread-safe books
+        self.pre_hooks = []
+        self.post_hooks = []
+
+    def run(self, args, book):
+        if book.lock is None:
+            return self._run(args, book)
+        if self.mutates:
+            book.lock.acquire_write()
+            release = book.lock.release_write
+        else:
+            book.lock.acquire_read()
+            release = book.lock.release_read
+        try:
+            result = self._run(args, book)
+        except BaseException:
+            release()
+            raise
+        if result is None or isinstance(result, str):
+            release()
+            return result
+        # chunks are rendered while the caller writes them out, so the lock is kept until they are consumed
+        return HeldChunks(result, release)
+
+    def _run(self, args, book):
+        result = None
+        for hook in PRE_HOOKS + self.pre_hooks:
+            # pre hook may answer instead of the handler (cache, dry run and so on)
+            result = hook(self, args, book)
+            if result is not None:
+                break
+        if result is None:
+            result = self.handler(args, book) if self.takes_args else self.handler(book)
+        for hook in self.post_hooks + POST_HOOKS:
+            result = hook(self, args, book, result)
+        return result
+
+class HeldChunks:
+    """
+    Output chunks of a command that keep the book lock until all of them are read or the output is dropped
+    """
+    def __init__(self, chunks, release):
+        self._chunks = iter(chunks)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+    __del__ = close
+
+def output_chunks(result):
+    """
+    Command result as pieces of text to write: handlers return a string, None or an iterable of chunks
+    """
+    if result is None:
+        return ()
+    if isinstance(result, str):
+        return (result,)
+    return result
+
+COMMANDS = {} # command name or alias -> Command
+PRE_HOOKS = [] # hook(command, args, book), run before every command, non-None result replaces the handler
+POST_HOOKS = [] # hook(command, args, book, result), run after every command, returns (possibly changed) result
+
+def register_command(name, handler, *aliases, takes_args=True, mutates=False):
+    """
+    Adds handler to the bot commands, handler(args, book) or handler(book) if takes_args is False.
+    mutates=True marks commands that change the book
+    """
+    entry = Command(name, handler, aliases, takes_args, mutates)
+    for command_name in (name, *aliases):
+        COMMANDS[command_name] = entry
+    return entry
+
+def command(name, *aliases, takes_args=True, mutates=False):
+    """
+    Decorator registering function as bot command
+    """
+    def decorator(func):
+        register_command(name, func, *aliases, takes_args=takes_args, mutates=mutates)
+        return func
+    return decorator
+
+def add_hook(pre=None, post=None, commands=None):
+    """
+    Attaches pre and/or post hook to given command names, or to every command if commands is None
+    """
+    targets = [COMMANDS[name] for name in commands] if commands is not None else None
+    if pre is not None:
+        if targets is None:
+            PRE_HOOKS.append(pre)
+        for entry in targets or []:
+            entry.pre_hooks.append(pre)
+    if post is not None:
+        if targets is None:
+            POST_HOOKS.append(post)
+        for entry in targets or []:
+            entry.post_hooks.append(post)
+
+@command("hello", takes_args=False)
+def hello(book:AddressBook):
+    """
+    Greets the user
+    """
+    return "How can I help you?"
+
+@command("exit", "close", takes_args=False)
+def good_bye(book:AddressBook):
+    """
+    Says good bye, the bot loop stops after exit commands
+    """
+    return "Good bye!"
+
+@command("add", mutates=True)
 @input_error
 def add_contact(args, book:AddressBook):
     """
@@ -173,6 +2370,7 @@ def add_contact(args, book:AddressBook):
         record.add_phone(phone)
     return message
 
+@command("change", mutates=True)
 @input_error
 def change_contact(args, book:AddressBook):
     """
@@ -187,10 +2385,11 @@ def change_contact(args, book:AddressBook):
             record.edit_phone(old_phone, new_phone)
             return "Contact updated"
         else:
-            return "New number must has 10 digits"
+            return ErrorMessage("New number must has 10 digits")
     else:
-        return "There is no such Contact in your book" 
+        return ErrorMessage("There is no such Contact in your book")
 
+@command("phone")
 @input_error
 def show_phone(args, book:AddressBook):
     """
@@ -210,6 +2409,53 @@ def show_phone(args, book:AddressBook):
     else:
         return f"There is no {name.title()} in your book, please add it first"
 
+@command("who")
+@input_error
+def who_is(args, book:AddressBook):
+    """
+    Shows contact(s) owning given phone number.
+    requires phone number.
+    """
+    phone = args[0]
+    records = book.find_by_phone(phone)
+    if records:
+        return "\n".join(str(record) for record in records)
+    else:
+        return f"There is no contact with phone {phone} in your book"
+
+@command("search")
+@input_error
+def search_contacts(args, book:AddressBook):
+    """
+    Shows contacts whose name starts with given fragment.
+    With optional number of allowed typos shows contacts with similar names instead.
+    """
+    fragment, *rest = args
+    max_distance = int(rest[0]) if rest else 0
+    if max_distance < 0:
+        raise ValueError("Number of typos can't be negative")
+    records = book.search(fragment, max_distance)
+    if records:
+        return "\n".join(f"{record.name.value}: {record}" for record in records)
+    else:
+        return f"There is no contacts matching {fragment} in your book"
+
+ALL_CHUNK_LINES = 500 # contacts rendered per written chunk of 'all' output
+ALL_PAGE_SIZE = 20
+
+def render_contacts(records):
+    """
+    Yields chunks of "name: record" lines, so big books are written out piece by piece
+    """
+    output_lines = []
+    for name, record in records:
+        output_lines.append(f"{name}: {record}")
+        if len(output_lines) == ALL_CHUNK_LINES:
+            yield "\n".join(output_lines)
+            output_lines = []
+    if output_lines:
+        yield "\n".join(output_lines)
+
 def show_all(book:AddressBook):
     """
     Shows all contacts and their numbers saved during session
@@ -217,12 +2463,50 @@ def show_all(book:AddressBook):
     if not book:
         return "No contacts found"
     
-    output_lines = []
-    for name, phone in book.data.items():
-        output_lines.append(f"{name}: {phone}")
-    
-    return "\n".join(output_lines)
+    # output is written lazily and other server sessions may add or delete contacts meanwhile,
+    # so names are taken up front and contacts deleted since then are skipped
+    names = list(book.data)
+    records = ((name, book.data.get(name)) for name in names)
+    return render_contacts((name, record) for name, record in records if record is not None)
+
+def show_page(book:AddressBook, page=1, size=ALL_PAGE_SIZE, after=None):
+    """
+    Shows one page of contacts sorted by name, by page number or going after given name (cursor)
+    """
+    records = book.page(size, page, after)
+    if not records:
+        return "No contacts found"
+    if after is None:
+        pages = -(-len(book) // size)
+        footer = f"Page {page} of {pages}"
+    else:
+        footer = f"Next page: all after {records[-1][0]} {size}"
+    return itertools.chain(render_contacts(records), [footer])
 
+@command("all")
+@input_error
+def all_contacts(args, book:AddressBook):
+    """
+    Shows all contacts, or one page of them:
+    'all <page> [size]' or 'all after <name> [size]' to continue after given contact.
+    """
+    if not args:
+        return show_all(book)
+    if args[0].lower() == "after":
+        after = args[1]
+        size = int(args[2]) if len(args) > 2 else ALL_PAGE_SIZE
+        page = None
+    else:
+        after = None
+        page = int(args[0])
+        size = int(args[1]) if len(args) > 1 else ALL_PAGE_SIZE
+        if page < 1:
+            raise ValueError("Page numbers start from 1")
+    if size < 1:
+        raise ValueError("Page size must be positive")
+    return show_page(book, page, size, after)
+
+@command("add-birthday", mutates=True)
 @input_error
 def add_birthday(args, book:AddressBook):
     """
@@ -230,10 +2514,13 @@ def add_birthday(args, book:AddressBook):
     """
     name, birthday_date_string, *_ = args
     record:Record = book.find(name.title())
-    bithday = Birthday(birthday_date_string)
-    record.add_birthday(bithday.value.strftime("%d.%m.%Y"))
+    if record is None:
+        Birthday(birthday_date_string) # wrong date is reported first, even for unknown contact
+        return ErrorMessage(f"There is no {name.title()} in your book, please add it first")
+    record.add_birthday(birthday_date_string)
     return f"Birthday for {record.name} was successfully updated"
 
+@command("show-birthday")
 @input_error
 def show_birthday(args, book:AddressBook):
     """
@@ -250,15 +2537,228 @@ def show_birthday(args, book:AddressBook):
     else:
         return f"There is no {name.title()} in your book, please add it first"
     
-def birthdays(book:AddressBook):
+@command("birthdays")
+@input_error
+def birthdays(args, book:AddressBook):
     """
     Shows congratulation list for the contacts in the book that needs to be congratulated.
     Shows congratulation date as well.
+    Optional argument sets how many days ahead to look, 7 by default.
     """
+    days = int(args[0]) if args else 7
+    if days < 0:
+        raise ValueError("Number of days can't be negative")
     if not book:
         return "No contacts found in your book"
+    result = book.get_upcoming_birthdays(days)
+    if isinstance(result, list):
+        return "\n".join([f"Congratulations list for next {days} days:", *(str(contact) for contact in result)])
     else:
-        return book.get_upcoming_birthdays()
+        return result
+
+@command("import", mutates=True)
+@input_error
+def import_contacts(args, book:AddressBook):
+    """
+    Imports contacts from CSV or JSONL file.
+    requires file path.
+    """
+    path = args[0]
+    try:
+        report = book.bulk_import(path)
+    except OSError:
+        return ErrorMessage(f"Can't read file {path}")
+    lines = [f"Imported from {path}: {report['added']} added, {report['updated']} updated, {report['rejected']} rejected"]
+    for line_number, reason in report["rejected_rows"]:
+        lines.append(f" line {line_number}: {reason}")
+    if report["rejected"] > len(report["rejected_rows"]):
+        lines.append(f" ... and {report['rejected'] - len(report['rejected_rows'])} more")
+    return "\n".join(lines)
+
+def command_metrics():
+    """
+    Copy of collected metrics as {command name: {calls, errors, seconds, buckets}}, only commands that were called
+    """
+    names = {}
+    for entry in COMMANDS.values():
+        names.setdefault(entry.handler.__name__, entry.name)
+    return {
+        names.get(handler, handler): {
+            "calls": metrics.calls,
+            "errors": dict(metrics.errors),
+            "seconds": metrics.total_seconds,
+            "buckets": dict(zip([*LATENCY_BUCKETS, "+Inf"], metrics.buckets)),
+        }
+        for handler, metrics in list(METRICS.items()) if metrics.calls
+    }
+
+def latency_percentile(data, fraction):
+    """
+    Upper bound (in ms, as text) of the latency bucket where given fraction of calls ends
+    """
+    needed = data["calls"] * fraction
+    seen = 0
+    for bound, count in data["buckets"].items():
+        seen += count
+        if count and seen >= needed:
+            return f"<{bound * 1000:g}" if bound != "+Inf" else f">{LATENCY_BUCKETS[-1] * 1000:g}"
+    return "-"
+
+def metrics_prometheus(snapshot):
+    """
+    Metrics in Prometheus text exposition format
+    """
+    lines = [
+        "# HELP bot_command_calls_total Calls of bot command handlers.",
+        "# TYPE bot_command_calls_total counter",
+    ]
+    lines += [f'bot_command_calls_total{{command="{name}"}} {data["calls"]}' for name, data in snapshot.items()]
+    lines += [
+        "# HELP bot_command_errors_total Failed bot commands by exception type.",
+        "# TYPE bot_command_errors_total counter",
+    ]
+    for name, data in snapshot.items():
+        lines += [f'bot_command_errors_total{{command="{name}",error="{error}"}} {count}' for error, count in data["errors"].items()]
+    lines += [
+        "# HELP bot_command_latency_seconds Latency of bot command handlers.",
+        "# TYPE bot_command_latency_seconds histogram",
+    ]
+    for name, data in snapshot.items():
+        cumulative = 0
+        for bound, count in data["buckets"].items():
+            cumulative += count
+            lines.append(f'bot_command_latency_seconds_bucket{{command="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'bot_command_latency_seconds_sum{{command="{name}"}} {data["seconds"]:.6f}')
+        lines.append(f'bot_command_latency_seconds_count{{command="{name}"}} {data["calls"]}')
+    return "\n".join(lines) + "\n"
+
+def export_metrics(path):
+    """
+    Writes metrics to path: JSON if it ends with .json, Prometheus text format otherwise.
+    File is replaced atomically, so collectors never read half written file
+    """
+    snapshot = command_metrics()
+    text = json.dumps(snapshot, indent=2) if path.endswith(".json") else metrics_prometheus(snapshot)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temporary_path, path)
+
+def export_metrics_every(path, interval):
+    """
+    Rewrites metrics file every interval seconds in background thread, returns event that stops it
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                export_metrics(path)
+            except OSError:
+                pass # e.g. directory is gone for a moment, the next round tries again
+
+    threading.Thread(target=loop, name="metrics-export", daemon=True).start()
+    return stop
+
+@command("stats")
+@input_error
+def show_stats(args, book:AddressBook):
+    """
+    Shows calls, errors and latency of every used command.
+    'stats <path>' writes them to file instead (JSON for .json, Prometheus text format otherwise)
+    """
+    if args:
+        path = args[0]
+        try:
+            export_metrics(path)
+        except OSError:
+            return ErrorMessage(f"Can't write file {path}")
+        return f"Stats written to {path}"
+    snapshot = command_metrics()
+    if not snapshot:
+        return "No commands were run yet"
+    lines = [f"{'command':<14}{'calls':>8}{'errors':>8}{'avg ms':>10}{'p50 ms':>10}{'p99 ms':>10}"]
+    for name, data in sorted(snapshot.items()):
+        p50, p99 = (latency_percentile(data, fraction) for fraction in (0.5, 0.99))
+        errors = sum(data["errors"].values())
+        lines.append(f"{name:<14}{data['calls']:>8}{errors:>8}{data['seconds'] / data['calls'] * 1000:>10.3f}{p50:>10}{p99:>10}")
+        if errors:
+            lines.append("  " + ", ".join(f"{error}: {count}" for error, count in sorted(data["errors"].items())))
+    return "\n".join(lines)
+
+@command("changes")
+@input_error
+def show_changes(args, book:AddressBook):
+    """
+    Shows changes made after given sequence number (0 by default) as JSON lines [seq, kind, name, *args].
+    Needs the bot started with --change-feed
+    """
+    if book.feed is None:
+        return "Change feed is off, start the bot with --change-feed"
+    seq = int(args[0]) if args else 0
+    try:
+        events = book.feed.since(seq)
+    except ChangeFeedGap as error:
+        return ErrorMessage(str(error))
+    if not events:
+        return f"No changes after {seq}"
+    return "\n".join(json.dumps([event.seq, event.kind, event.name, *event.args]) for event in events)
+
+@command("dedupe", mutates=True)
+@input_error
+def dedupe_contacts(args, book:AddressBook):
+    """
+    Finds contacts sharing phone numbers or names written differently.
+    Only shows them, 'dedupe apply' merges every group into its first contact.
+    """
+    apply = bool(args) and args[0].lower() == "apply"
+    report = book.dedupe(dry_run=not apply)
+    if not report["groups"]:
+        return "No duplicates found"
+    verb = "Merged" if apply else "Found"
+    lines = [f"{verb} {report['duplicates']} duplicates in {report['groups']} groups:"]
+    for kept, merged in report["merged"]:
+        lines.append(f" {kept} <- {', '.join(merged)}")
+    if report["groups"] > len(report["merged"]):
+        lines.append(f" ... and {report['groups'] - len(report['merged'])} more groups")
+    if not apply:
+        lines.append("Run 'dedupe apply' to merge them")
+    return "\n".join(lines)
+
+@command("export")
+@input_error
+def export_contacts(args, book:AddressBook):
+    """
+    Exports all contacts to file.
+    requires format (csv, jsonl or vcard) and file path, path ending with .gz is compressed.
+    """
+    format_name, path = args[0], args[1]
+    if format_name.lower() not in EXPORT_FORMATS:
+        return ErrorMessage(f"Unknown format {format_name}, use csv, jsonl or vcard")
+    try:
+        count = book.export(path, format_name)
+    except OSError:
+        return ErrorMessage(f"Can't write file {path}")
+    return f"Exported {count} contacts to {path}"
+
+@command("memory")
+@input_error
+def show_memory(args, book:AddressBook):
+    """
+    Shows memory taken by the book: total, per contact and by field type
+    """
+    usage = book.memory_usage()
+    if not usage["resident_contacts"]:
+        return "No contacts in memory"
+    lines = [
+        f"Contacts: {usage['contacts']} ({usage['resident_contacts']} in memory)",
+        f"Total: {usage['total_bytes'] / 2**20:.2f} MiB, {usage['bytes_per_contact']} bytes per contact",
+    ]
+    for field_type, size in usage["by_type"].items():
+        lines.append(f" {field_type:<10}{size / 2**20:>10.2f} MiB{size / usage['resident_contacts']:>10.1f} B/contact")
+    if usage["traced_bytes"] is not None:
+        lines.append(f"Traced by tracemalloc: {usage['traced_bytes'] / 2**20:.2f} MiB, peak {usage['traced_peak_bytes'] / 2**20:.2f} MiB")
+    return "\n".join(lines)
 
 def parse_input(user_input):
     """
@@ -276,56 +2776,302 @@ def parse_input(user_input):
     
     return cmd, args
 
+BOOK_SNAPSHOT_FILE = "addressbook.snapshot"
+BOOK_JOURNAL_FILE = "addressbook.journal"
+
 def main():
-    book = AddressBook()
+    parser = argparse.ArgumentParser(description="Assistant bot for your address book")
+    parser.add_argument("--db", metavar="PATH", help="keep the book in SQLite database instead of snapshot and journal files")
+    parser.add_argument("--batch", metavar="FILE", nargs="?", const="-",
+                        help="run commands from FILE (or stdin) without prompts, also used when stdin is piped")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="serve bot sessions over TCP instead of the console")
+    parser.add_argument("--socket", metavar="PATH", help="serve bot sessions over Unix socket instead of the console")
+    parser.add_argument("--max-connections", metavar="N", type=int, default=1000, help="limit of concurrent sessions for the server")
+    parser.add_argument("--vectorized", action="store_true", help="compute birthdays with NumPy (if installed), for very big books")
+    parser.add_argument("--flush-every", metavar="N", type=int, default=0,
+                        help="in batch mode write output every N commands instead of once at the end")
+    parser.add_argument("--change-feed", metavar="N", type=int, default=0,
+                        help="publish changes for 'changes' command, keeping last N of them")
+    parser.add_argument("--trace-memory", action="store_true", help="run tracemalloc, so 'memory' also shows allocated bytes")
+    parser.add_argument("--record", metavar="PATH", help="write every command line to trace file for support/load_test.py")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write command stats to PATH on exit (JSON for .json, Prometheus text format otherwise)")
+    parser.add_argument("--metrics-interval", metavar="SECONDS", type=float, default=15,
+                        help="how often the server rewrites --metrics file")
+    options = parser.parse_args()
+
+    if options.trace_memory:
+        tracemalloc.start()
+    if options.db:
+        book = SqliteAddressBook(options.db)
+    else:
+        book = open_book(BOOK_SNAPSHOT_FILE, BOOK_JOURNAL_FILE)
+    if options.vectorized:
+        book.enable_vectorized_birthdays()
+    if options.change_feed:
+        book.enable_change_feed(options.change_feed)
+    recorder = TraceRecorder(options.record) if options.record else None
+    try:
+        if options.serve or options.socket:
+            if options.metrics:
+                export_metrics_every(options.metrics, options.metrics_interval)
+            server = BotServer(book, options.max_connections, recorder)
+            if options.socket:
+                address = {"path": options.socket}
+            else:
+                host, _, port = options.serve.rpartition(":")
+                address = {"host": host or None, "port": int(port)}
+            try:
+                asyncio.run(server.serve_forever(**address))
+            except KeyboardInterrupt:
+                pass
+            return 0
+        if options.batch is None and sys.stdin.isatty():
+            run_bot(book, recorder)
+            return 0
+        if options.batch in (None, "-"):
+            return run_batch(book, sys.stdin, flush_every=options.flush_every, recorder=recorder)
+        with open(options.batch, encoding="utf-8") as script:
+            return run_batch(book, script, flush_every=options.flush_every, recorder=recorder)
+    finally:
+        book.close()
+        if recorder is not None:
+            recorder.close()
+        if options.metrics:
+            export_metrics(options.metrics)
+
+EXIT_COMMANDS = ["close", "exit"]
+
+def execute(command, args, book:AddressBook):
+    """
+    Runs one parsed command and returns text to show (None if there is nothing to show)
+    """
+    if command is None:
+        return None
+    entry = COMMANDS.get(command)
+    if entry is None:
+        return ErrorMessage("Invalid command.")
+    return entry.run(args, book)
+
+class TransactionFailed(Exception):
+    """
+    Command inside transaction failed, makes AddressBook.batch() roll everything back
+    """
+    def __init__(self, number, command, message):
+        super().__init__(message)
+        self.number = number
+        self.command = command
+        self.message = message
+
+def run_transaction(book:AddressBook, commands):
+    """
+    Runs (command, args) pairs in one AddressBook.batch() holding the book lock once for all of them.
+    If any command fails, changes of all of them are rolled back
+    """
+    if book.lock is not None:
+        book.lock.acquire_write()
+    try:
+        outputs = []
+        with book.batch():
+            for number, (command, args) in enumerate(commands, start=1):
+                result = COMMANDS[command]._run(args, book)
+                if isinstance(result, ErrorMessage):
+                    raise TransactionFailed(number, command, result)
+                outputs.extend(output_chunks(result))
+    except TransactionFailed as failure:
+        return ErrorMessage(f"Transaction rolled back, command {failure.number} ({failure.command}) failed: {failure.message}")
+    finally:
+        if book.lock is not None:
+            book.lock.release_write()
+    outputs.append(f"Transaction committed, {len(commands)} commands")
+    return "\n".join(outputs)
+
+class TraceRecorder:
+    """
+    Writes every command line the bot gets to JSON lines trace: {"t": seconds since start, "session": number, "line": text}.
+    support/load_test.py replays such traces
+    """
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8")
+        self._started = time.monotonic()
+        self._sessions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_session(self):
+        return next(self._sessions)
+
+    def record(self, session, line):
+        entry = json.dumps({"t": round(time.monotonic() - self._started, 6), "session": session, "line": line})
+        with self._lock:
+            self._file.write(entry + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class BotSession:
+    """
+    One user talking to the bot: commands between 'begin' and 'commit' are queued
+    and run together as a transaction, 'rollback' drops them
+    """
+    def __init__(self, book:AddressBook, recorder:TraceRecorder=None):
+        self.book = book
+        self.pending = None # queued (command, args) while transaction is open
+        self.recorder = recorder
+        self.trace_session = recorder.new_session() if recorder is not None else None
+
+    def handle(self, line):
+        """
+        Parses and runs one input line, returns (command, result)
+        """
+        if self.recorder is not None and line.strip():
+            self.recorder.record(self.trace_session, line.strip())
+        command, args = parse_input(line)
+        return command, self.execute(command, args)
+
+    def execute(self, command, args):
+        if command == "begin":
+            if self.pending is not None:
+                return ErrorMessage("Transaction is already open, 'commit' or 'rollback' it first")
+            self.pending = []
+            return "Transaction started, commands run on 'commit'"
+        if command in ("commit", "rollback"):
+            if self.pending is None:
+                return ErrorMessage("There is no open transaction, start it with 'begin'")
+            commands, self.pending = self.pending, None
+            if command == "rollback":
+                return f"Transaction rolled back, {len(commands)} commands dropped"
+            return run_transaction(self.book, commands)
+        if self.pending is not None and command is not None and command not in EXIT_COMMANDS:
+            if command not in COMMANDS:
+                return ErrorMessage("Invalid command.")
+            self.pending.append((command, args))
+            return None
+        return execute(command, args, self.book)
+
+def run_bot(book:AddressBook, recorder:TraceRecorder=None):
     print("Welcome to the assistant bot!")
+    session = BotSession(book, recorder)
 
     while True:
         user_input = input("Enter a command: ")
-        command, args = parse_input(user_input)
-
-        if command in ["close", "exit"]:
-            print("Good bye!")
+        command, result = session.handle(user_input)
+        for chunk in output_chunks(result):
+            print(chunk)
+        if command in EXIT_COMMANDS:
             break
-        
-        elif command == "hello":
-            print("How can I help you?")
-            
-        elif command == "add":
-            print(add_contact(args, book))
-            
-        elif command == "change":
-            print(change_contact(args, book))
-            
-        elif command == "phone":
-            print(show_phone(args, book))
-        
-        elif command == "all":
-            print(show_all(book))
-            
-        elif command == "add-birthday":
-            print(add_birthday(args,book))
-
-        elif command == "show-birthday":
-            print(show_birthday(args,book))
-
-        elif command == "birthdays":
-            result = birthdays(book)
-            if isinstance(result, list):
-                print("Congratulations list for next seven days:")
-                for contact in result:
-                    print(contact)
-            else:
-                print(result)
-            
-        elif command is None:
-            continue
 
-        else:
-            print("Invalid command.")
+def run_batch(book:AddressBook, lines, output=None, flush_every=0, recorder:TraceRecorder=None):
+    """
+    Runs commands from lines (file or piped stdin) without prompts.
+    Output is buffered and written once at the end, or every flush_every commands.
+    Returns exit status: 0 if every command succeeded, 1 if any of them failed
+    """
+    output = output or sys.stdout
+    session = BotSession(book, recorder)
+    buffer = []
+    failed = 0
+    try:
+        for count, line in enumerate(lines, start=1):
+            command, result = session.handle(line)
+            if isinstance(result, str):
+                buffer.append(result)
+                if isinstance(result, ErrorMessage):
+                    failed += 1
+            elif result is not None:
+                # streamed output (like 'all') goes straight to the output instead of the buffer
+                if buffer:
+                    output.write("\n".join(buffer) + "\n")
+                    buffer.clear()
+                for chunk in result:
+                    output.write(chunk + "\n")
+            if command in EXIT_COMMANDS:
+                break
+            if flush_every and count % flush_every == 0 and buffer:
+                output.write("\n".join(buffer) + "\n")
+                buffer.clear()
+    finally:
+        # replies of commands before a crashing one are written too
+        if buffer:
+            output.write("\n".join(buffer) + "\n")
+        output.flush()
+    return 1 if failed else 0
+
+class BotServer:
+    """
+    Serves bot sessions over TCP or Unix socket, one line per command, all sessions share one book.
+    Sessions run as asyncio tasks in one thread, commands are executed one at a time between awaits.
+    Empty line is answered with empty line, so clients can find where the previous answer ends.
+    """
+    def __init__(self, book:AddressBook, max_connections=1000, recorder:TraceRecorder=None):
+        self.book = book
+        self.max_connections = max_connections
+        self.connections = 0
+        self.recorder = recorder
+
+    async def handle_session(self, reader, writer):
+        if self.connections >= self.max_connections:
+            writer.write(b"Server is busy, try again later\n")
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            return
+        self.connections += 1
+        session = BotSession(self.book, self.recorder)
+        try:
+            writer.write(b"Welcome to the assistant bot!\n")
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    break # line longer than the stream limit
+                if not line:
+                    break
+                command, result = session.handle(line.decode("utf-8", errors="replace"))
+                if command is None:
+                    writer.write(b"\n")
+                for chunk in output_chunks(result):
+                    writer.write(chunk.encode("utf-8") + b"\n")
+                    # waits while the client is not reading, so slow clients don't pile up output in memory
+                    await writer.drain()
+                if command in EXIT_COMMANDS:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host=None, port=None, path=None):
+        """
+        Starts listening on Unix socket path if given, TCP host:port otherwise
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_session, path=path, backlog=self.max_connections)
+        return await asyncio.start_server(self.handle_session, host, port, backlog=self.max_connections)
+
+    async def serve_forever(self, host=None, port=None, path=None):
+        """
+        Serves until SIGTERM (or Ctrl+C), then stops so the caller can close the book
+        """
+        server = await self.start(host, port, path)
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except NotImplementedError:
+            pass # no signal handlers in Windows event loop, Ctrl+C still works
+        try:
+            await stop.wait()
+        finally:
+            # open sessions are cancelled when asyncio.run() finishes
+            server.close()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
 
 #--------------------------------------------------- BOT ENDS --------------------------------------------------------------------------